@@ -4,6 +4,8 @@ import logo from "../assets/logo.png";
 
 
 const API_BASE = import.meta.env.VITE_API_BASE_URL;
+const MAX_RESUMES = 3;
+const RESUME_DELAY_MS = 1000;
 
 export default function DownloadPage() {
   const { token } = useParams();
@@ -14,19 +16,33 @@ export default function DownloadPage() {
   const [readyToDownload, setReadyToDownload] = useState(false);
   const [shake, setShake] = useState(false);
 
-  const handleDownload = async () => {
-    if (!pin) return;
-
-    setLoading(true);
-    setError("");
-    setReadyToDownload(false);
+  // Fetches the PDF, resuming with Range / If-Range if the connection
+  // drops; the same PIN keeps working until the download is confirmed.
+  const fetchPdf = async () => {
+    const chunks = [];
+    let received = 0;
+    let total = null;
+    let etag = null;
+
+    for (let attempt = 0; ; attempt++) {
+      const headers = { "Content-Type": "application/json" };
+      if (received > 0 && etag) {
+        headers["Range"] = `bytes=${received}-`;
+        headers["If-Range"] = etag;
+      }
 
-    try {
-      const res = await fetch(`${API_BASE}/api/download/verify`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ token, pin }),
-      });
+      let res;
+      try {
+        res = await fetch(`${API_BASE}/api/download/verify`, {
+          method: "POST",
+          headers,
+          body: JSON.stringify({ token, pin }),
+        });
+      } catch (err) {
+        if (attempt >= MAX_RESUMES) throw new Error("Download interrupted. Please try again.");
+        await new Promise((r) => setTimeout(r, RESUME_DELAY_MS));
+        continue;
+      }
 
       if (!res.ok) {
         const msg = await res.json();
@@ -37,11 +53,59 @@ export default function DownloadPage() {
         throw new Error(msg.detail || "Invalid PIN");
       }
 
-
       // ✅ PIN verified
       setReadyToDownload(true);
 
-      const blob = await res.blob();
+      // 200 = whole file (first request, or the server ignored the range)
+      if (res.status === 200) {
+        chunks.length = 0;
+        received = 0;
+      }
+
+      etag = res.headers.get("ETag");
+      const range = res.headers.get("Content-Range");
+      total = range
+        ? Number(range.split("/")[1])
+        : Number(res.headers.get("Content-Length")) || null;
+
+      try {
+        const reader = res.body.getReader();
+        for (;;) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          chunks.push(value);
+          received += value.length;
+        }
+      } catch (err) {
+        // Connection dropped mid-body; resume below
+      }
+
+      if (total === null || received >= total) {
+        return new Blob(chunks, { type: "application/pdf" });
+      }
+
+      if (attempt >= MAX_RESUMES) throw new Error("Download interrupted. Please try again.");
+      await new Promise((r) => setTimeout(r, RESUME_DELAY_MS));
+    }
+  };
+
+  const handleDownload = async () => {
+    if (!pin) return;
+
+    setLoading(true);
+    setError("");
+    setReadyToDownload(false);
+
+    try {
+      const blob = await fetchPdf();
+
+      // Every byte arrived: the link can be used up now
+      fetch(`${API_BASE}/api/download/complete`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ token, pin }),
+      }).catch(() => {});
+
       const url = window.URL.createObjectURL(blob);
 
       // Small delay so user sees the message
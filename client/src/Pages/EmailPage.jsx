@@ -73,10 +73,16 @@ const [stepIndex, setStepIndex] = useState(0);
         formData.append("phone", phone);
       }
 
-      // 🔐 SEND SMS CONSENT (ONLY IF USER OPTED)
-      if (phone && smsConsent && session) {
+      // Rate limits are per signed session (not per shared store IP)
+      if (session) {
+        formData.append("session_id", session.session_id);
+        formData.append("session_token", session.session_token);
+      }
+
+      // 🔐 RECORD CONSENT (document + SMS if the user opted) IN ONE CALL
+      if (session) {
         try {
-          await fetch(`${API_BASE}/api/consent/sms`, {
+          const consentRes = await fetch(`${API_BASE}/api/consent`, {
             method: "POST",
             headers: {
               "Content-Type": "application/json",
@@ -84,10 +90,12 @@ const [stepIndex, setStepIndex] = useState(0);
             body: JSON.stringify({
               session_id: session.session_id,
               session_token: session.session_token,
+              consents: phone && smsConsent ? ["document", "sms"] : ["document"],
             }),
           });
+          if (!consentRes.ok) throw new Error("Consent not recorded");
         } catch (err) {
-          console.error("SMS consent failed", err);
+          console.error("Consent failed", err);
           setError(true);
           setLoading(false);
           return;
@@ -123,21 +123,8 @@ return (
   const confirmScan = async () => {
   if (!image || !consentAccepted || !session) return;
 
-  try {
-    await fetch(`${import.meta.env.VITE_API_BASE_URL}/api/consent/document`, {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-      },
-      body: JSON.stringify({
-        session_id: session.session_id,
-        session_token: session.session_token,
-      }),
-    });
-  } catch (err) {
-    console.error("Document consent failed", err);
-    return;
-  }
+  // Document consent is recorded together with SMS consent on submit
+  // (one /api/consent call from EmailPage)
 
   // ✅ keep your existing processing UI
   setProcessing(true);
@@ -4,13 +4,15 @@ import uuid
 import hmac
 import hashlib
 from datetime import datetime, timezone
+from typing import Literal
 
 from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel
 
 from app.utils.session import verify_session
 from app.utils.ip import get_client_ip
-from app.utils.r2 import upload_json_to_r2
+from app.services.consent_log import record_consent
+from app.utils.circuit_breaker import CircuitOpenError
 
 router = APIRouter(tags=["consent"])
 
@@ -20,6 +22,27 @@ class ConsentBase(BaseModel):
     session_token: str
 
 
+class ConsentRequest(ConsentBase):
+    consents: list[Literal["document", "sms"]]
+
+
+# Per-type terms recorded in the signed document
+CONSENT_TERMS = {
+    "document": {
+        "consent_type": "document_handling",
+        "consent_version": "doc_v1.0",
+    },
+    "sms": {
+        "consent_type": "sms_transactional",
+        "consent_scope": "one_time_transactional",
+        "consent_version": "sms_v1.0",
+    },
+}
+
+# Signed documents recording several consent types at once
+MULTI_CONSENT_SCHEMA_VERSION = "multi_v1"
+
+
 def sign_consent(data: dict) -> str:
     secret = os.getenv("CONSENT_SIGNING_SECRET")
     msg = json.dumps(data, sort_keys=True).encode()
@@ -36,10 +59,19 @@ def validate_session(payload: ConsentBase):
         raise HTTPException(403, "Invalid session token")
 
 
-@router.post("/consent/document")
-async def document_consent(payload: ConsentBase, request: Request):
+async def record_consents(payload: ConsentBase, request: Request, types: list[str]):
+    """
+    Validate the session once and record every consent type in one
+    signed document (one write). A single type is signed in the
+    original per-type format (terms at the top level); several types
+    are listed under "consents" with an explicit schema_version.
+    """
     validate_session(payload)
 
+    types = list(dict.fromkeys(types))  # dedupe, keep order
+    if not types:
+        raise HTTPException(400, "No consent types given")
+
     timestamp = datetime.now(timezone.utc).isoformat()
     ip = get_client_ip(request)
     ua = request.headers.get("user-agent", "unknown")
@@ -50,48 +82,38 @@ async def document_consent(payload: ConsentBase, request: Request):
 
     consent = {
         "consent_given": True,
-        "consent_type": "document_handling",
         "consent_method": "checkbox",
-        "consent_version": "doc_v1.0",
         "timestamp_utc": timestamp,
         "ip_hash": ip_hash,
         "user_agent": ua
     }
 
+    if len(types) == 1:
+        consent.update(CONSENT_TERMS[types[0]])
+    else:
+        consent["schema_version"] = MULTI_CONSENT_SCHEMA_VERSION
+        consent["consents"] = [CONSENT_TERMS[t] for t in types]
+
     consent["signature"] = sign_consent(consent)
 
-    key = f"consents/session_{payload.session_id}/consent.document.json"
-    await upload_json_to_r2(key, consent)
+    try:
+        await record_consent(payload.session_id, "+".join(types), consent)
+    except CircuitOpenError:
+        raise HTTPException(503, "Consent storage is temporarily unavailable")
 
-    return {"status": "ok"}
+    return {"status": "ok", "consents": types}
 
 
-@router.post("/consent/sms")
-async def sms_consent(payload: ConsentBase, request: Request):
-    validate_session(payload)
+@router.post("/consent")
+async def combined_consent(payload: ConsentRequest, request: Request):
+    return await record_consents(payload, request, payload.consents)
 
-    timestamp = datetime.now(timezone.utc).isoformat()
-    ip = get_client_ip(request)
-    ua = request.headers.get("user-agent", "unknown")
-
-    ip_hash = hashlib.sha256(
-        (ip + os.getenv("IP_HASH_SALT", "")).encode()
-    ).hexdigest()
 
-    consent = {
-        "consent_given": True,
-        "consent_type": "sms_transactional",
-        "consent_method": "checkbox",
-        "consent_scope": "one_time_transactional",
-        "consent_version": "sms_v1.0",
-        "timestamp_utc": timestamp,
-        "ip_hash": ip_hash,
-        "user_agent": ua
-    }
-
-    consent["signature"] = sign_consent(consent)
+@router.post("/consent/document")
+async def document_consent(payload: ConsentBase, request: Request):
+    return await record_consents(payload, request, ["document"])
 
-    key = f"consents/session_{payload.session_id}/consent.sms.json"
-    await upload_json_to_r2(key, consent)
 
-    return {"status": "ok"}
+@router.post("/consent/sms")
+async def sms_consent(payload: ConsentBase, request: Request):
+    return await record_consents(payload, request, ["sms"])
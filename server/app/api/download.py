@@ -1,10 +1,22 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
-from datetime import datetime
-from pathlib import Path
+import asyncio
+
+from fastapi import APIRouter, Header, HTTPException
 from pydantic import BaseModel
 
-from app.utils.token_store import get_token, invalidate_token
+from app.services.pdf_service import PDF_FILENAME
+from app.utils.blob_store import blob_path, delete_blob, get_blob
+from app.utils.circuit_breaker import CircuitOpenError
+from app.utils.range_response import BlobResponse, blob_etag, parse_range
+from app.utils.token_store import (
+    redeem_token,
+    complete_token,
+    NOT_FOUND,
+    EXPIRED,
+    ALREADY_USED,
+    LOCKED,
+    LOCKED_NOW,
+    INVALID_PIN,
+)
 
 router = APIRouter()
 
@@ -15,62 +27,103 @@ class VerifyRequest(BaseModel):
 
 
 @router.post("/api/download/verify")
-def verify_and_download(data: VerifyRequest):
-    record = get_token(data.token)
+async def verify_and_download(
+    data: VerifyRequest,
+    range_header: str | None = Header(None, alias="Range"),
+    if_range: str | None = Header(None, alias="If-Range"),
+):
+    # Single atomic check-and-transition in the token store
+    outcome, record = await asyncio.to_thread(redeem_token, data.token, data.pin)
 
     # 1️⃣ Token exists
-    if not record:
+    if outcome == NOT_FOUND:
         raise HTTPException(status_code=404, detail="Invalid or expired link")
 
     # 2️⃣ Expired
-    if datetime.utcnow() > record["expires_at"]:
+    if outcome == EXPIRED:
         raise HTTPException(status_code=403, detail="This link has expired")
 
     # 3️⃣ Already used
-    if record["used"]:
+    if outcome == ALREADY_USED:
         raise HTTPException(status_code=403, detail="This link has already been used")
 
     # 4️⃣ Locked due to too many attempts
-    if record["locked"]:
+    if outcome == LOCKED:
         raise HTTPException(
             status_code=403,
             detail="This link has been locked due to multiple invalid PIN attempts"
         )
 
     # 5️⃣ PIN check
-    if data.pin != record["pin"]:
-        record["attempts"] += 1
-
-        # Lock if max attempts reached
-        if record["attempts"] >= record["max_attempts"]:
-            record["locked"] = True
-            raise HTTPException(
-                status_code=403,
-                detail="Too many invalid PIN attempts. This link has been locked."
-            )
+    if outcome == LOCKED_NOW:
+        raise HTTPException(
+            status_code=403,
+            detail="Too many invalid PIN attempts. This link has been locked."
+        )
 
+    if outcome == INVALID_PIN:
         remaining = record["max_attempts"] - record["attempts"]
         raise HTTPException(
             status_code=403,
             detail=f"Invalid PIN. {remaining} attempt(s) remaining."
         )
 
-    # ✅ PIN correct → SUCCESS
-    record["used"] = True
-    file_path = Path(record["file_path"])
+    # ✅ PIN correct → SUCCESS. The link stays usable (same PIN, Range
+    # resumes) for the grace window, until the client confirms below.
+    blob_key = record["blob_key"]
+
+    # Local disk: served from the file itself
+    file_path = blob_path(blob_key)
+    pdf_bytes = None
+
+    if file_path is not None:
+        try:
+            size = file_path.stat().st_size
+        except FileNotFoundError:
+            file_path = None
+
+    # Object store: fetched + decrypted in memory
+    if file_path is None:
+        try:
+            pdf_bytes = await get_blob(blob_key)
+        except CircuitOpenError as e:
+            # Storage known to be down; the link stays valid for a retry
+            raise HTTPException(
+                status_code=503,
+                detail="Download is temporarily unavailable. Please try again shortly.",
+                headers={"Retry-After": str(int(e.retry_after) + 1)},
+            )
 
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not available")
+        if pdf_bytes is None:
+            raise HTTPException(status_code=404, detail="File not available")
+        size = len(pdf_bytes)
 
-    invalidate_token(data.token)
+    etag = blob_etag(blob_key)
 
-    return FileResponse(
+    return BlobResponse(
+        size=size,
+        etag=etag,
+        filename=PDF_FILENAME,
+        byte_range=parse_range(range_header, if_range, etag, size),
         path=file_path,
-        filename=file_path.name,
-        media_type="application/pdf",
-        background=lambda: file_path.unlink(missing_ok=True),
+        data=pdf_bytes,
     )
 
+
+@router.post("/api/download/complete")
+async def complete_download(data: VerifyRequest):
+    """
+    Sent by the download page once it holds every byte. Bytes the
+    server wrote may still be lost in transit, so only the client can
+    say the download finished; without this, the grace window ends it.
+    """
+    blob_key = await asyncio.to_thread(complete_token, data.token, data.pin)
+    if blob_key is None:
+        raise HTTPException(status_code=404, detail="Invalid or expired link")
+
+    await delete_blob(blob_key)
+    return {"status": "completed"}
+
 # -----------------------------
 # 1. PIN ENTRY PAGE
 # -----------------------------
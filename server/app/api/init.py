@@ -1,11 +1,14 @@
 import uuid
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from app.utils.session import sign_session
+from app.utils.rate_limit import limit_init
 
 router = APIRouter(tags=["init"])
 
 @router.post("/init")
-async def init_session():
+async def init_session(request: Request):
+    await limit_init(request)
+
     session_id = str(uuid.uuid4())
     session_token = sign_session(session_id)
 
@@ -4,155 +4,358 @@ from fastapi import (
     File,
     Form,
     HTTPException,
+    Query,
     Request,
 )
-from pathlib import Path
-from uuid import uuid4
-import tempfile
-import shutil
-import asyncio
+from fastapi.responses import JSONResponse
+from functools import partial
+import hashlib
 import os
+import time
 
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-
-from app.services.pdf_service import image_to_pdf
+from app.services.pipeline import render_batch, PipelineBusyError, PIPELINE_MAX_QUEUE
+from app.services.jobs import enqueue_job, get_job, job_status, JobQueueFullError
+from app.services.pdf_service import PDF_FILENAME, PDF_PROFILE, PDF_PROFILES
 from app.services.email_service import send_email_with_attachment
-from app.utils.token_store import create_download_token
+from app.utils.token_store import create_download_token, invalidate_token, DEFAULT_EXPIRY_MINUTES
+from app.utils.blob_store import put_blob, delete_blob, BlobStoreFullError
+from app.utils.upload import read_image_upload
+from app.utils.rate_limit import limit_scan
 from app.services.sms_service import send_sms
-# from app.services.image_processing import process_image
+from app.services.outbox import DELIVERY_MODE, OUTBOX_BLOB_TTL_SECONDS, enqueue_deliveries
+from app.services.delivery import fan_out
+from app.utils.circuit_breaker import CircuitOpenError
+from app.utils.metrics import stage, traced_peak
 
 
 router = APIRouter()
-limiter = Limiter(key_func=get_remote_address)
-
-BASE_TEMP_DIR = Path(tempfile.gettempdir()) / "live_scan"
-BASE_TEMP_DIR.mkdir(parents=True, exist_ok=True)
 
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
+# A batch is admitted to the pipeline whole; a bigger one could never fit
+MAX_BATCH_PAGES = min(int(os.getenv("MAX_BATCH_PAGES", 10)), PIPELINE_MAX_QUEUE)
 FRONTEND_BASE_URL = os.getenv("FRONTEND_BASE_URL")
 
 
 
 
+async def _run_scan(
+    images: list[bytes],
+    email_list: list[str],
+    phone: str | None,
+    pdf_profile: str = PDF_PROFILE,
+    set_stage=lambda stage: None,
+):
+    """
+    Pipeline stages shared by the synchronous and the queued scan:
+    render PDF (one page per image) -> email -> SMS token + text.
+    """
+    blob_key = None
+    sms_token = None
+    sms_pin = None
+    download_url = None
+
+    try:
+        # -----------------------------
+        # IMAGE PROCESSING + PDF (PROCESS POOL, IN MEMORY)
+        # -----------------------------
+        set_stage("processing")
+        with stage("render", bytes_in=sum(len(image) for image in images)) as timed:
+            pdf_bytes = await render_batch(images, pdf_profile)
+            timed.bytes_out = len(pdf_bytes)
+
+        if not pdf_bytes:
+            raise RuntimeError("PDF generation failed")
+
+        if DELIVERY_MODE == "outbox":
+            # -----------------------------
+            # OUTBOX: persist, journal, return (workers send + retry)
+            # -----------------------------
+            set_stage("queued")
+
+            if phone and not FRONTEND_BASE_URL:
+                raise RuntimeError("FRONTEND_BASE_URL not set")
+
+            # With SMS the blob lives as long as the link; otherwise until
+            # the email is delivered (or the outbox gives up)
+            ttl = DEFAULT_EXPIRY_MINUTES * 60 if phone else OUTBOX_BLOB_TTL_SECONDS
+            blob_key = await put_blob(pdf_bytes, time.time() + ttl)
+
+            deliveries = [("email", {
+                "to_emails": email_list,
+                "blob_key": blob_key,
+                "filename": PDF_FILENAME,
+                # No download token will evict the blob
+                "discard_blob": not phone,
+            })]
+
+            if phone:
+                # The SMS worker reads the PIN back from the token store
+                sms_token, _ = create_download_token(blob_key=blob_key)
+                download_url = f"{FRONTEND_BASE_URL}/download/{sms_token}"
+
+                deliveries.append(("sms", {
+                    "phone": phone,
+                    "token_id": sms_token,
+                }))
+
+            await enqueue_deliveries(deliveries)
+
+            delivery = {channel: {"status": "queued"} for channel, _ in deliveries}
+
+        else:
+            # -----------------------------
+            # SMS TOKEN + PIN (local, before the fan-out)
+            # -----------------------------
+            if phone:
+                if not FRONTEND_BASE_URL:
+                    raise RuntimeError("FRONTEND_BASE_URL not set")
+
+                # Only the SMS download link needs the PDF to persist
+                blob_key = await put_blob(
+                    pdf_bytes, time.time() + DEFAULT_EXPIRY_MINUTES * 60
+                )
+
+                sms_token, sms_pin = create_download_token(blob_key=blob_key)
+
+                download_url = f"{FRONTEND_BASE_URL}/download/{sms_token}"
+
+            # -----------------------------
+            # Email + SMS concurrently, per-channel timeout / result
+            # -----------------------------
+            set_stage("delivering")
+
+            sends = {
+                "email": partial(
+                    send_email_with_attachment,
+                    to_emails=email_list,
+                    pdf_bytes=pdf_bytes,
+                    filename=PDF_FILENAME,
+                ),
+            }
+            if phone:
+                sends["sms"] = partial(
+                    send_sms,
+                    phone=phone,
+                    download_url=download_url,
+                    pin=sms_pin,
+                )
+
+            delivery = await fan_out(sends)
+
+            if all(result["status"] == "failed" for result in delivery.values()):
+                # Nothing reached the user; the link must not outlive the error
+                if sms_token is not None:
+                    invalidate_token(sms_token)
+                    sms_token = None
+
+                # Providers known to be down: tell the client to retry later
+                if all(result["error"] == "unavailable" for result in delivery.values()):
+                    raise CircuitOpenError("delivery", 0)
+
+                raise RuntimeError("Every delivery channel failed")
+
+    except HTTPException:
+        raise
+
+    except (PipelineBusyError, BlobStoreFullError):
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy. Please try again shortly."
+        )
+
+    except CircuitOpenError:
+        if blob_key is not None:
+            await delete_blob(blob_key)
+
+        raise HTTPException(
+            status_code=503,
+            detail="Delivery is temporarily unavailable. Please try again shortly."
+        )
+
+    except Exception as e:
+        print("ERROR:", str(e))
+
+        # Nothing was handed out, don't leave the PDF behind
+        if sms_token is None and blob_key is not None:
+            await delete_blob(blob_key)
+
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to process scan"
+        )
+
+    return {
+        "status": "success" if all(
+            result["status"] != "failed" for result in delivery.values()
+        ) else "partial",
+        "delivery": delivery,
+        "sent_to": email_list,
+        "pages": len(images),
+        "pdf": {
+            "profile": pdf_profile,
+            "bytes": len(pdf_bytes),
+        },
+        "sms": {
+            "enabled": bool(phone),
+            "download_url": download_url,
+            "pin": sms_pin,
+        },
+    }
+
+
+async def run_scan(
+    images: list[bytes],
+    email_list: list[str],
+    phone: str | None,
+    pdf_profile: str = PDF_PROFILE,
+    set_stage=lambda stage: None,
+):
+    """_run_scan, timed end to end (and memory-traced when sampled)."""
+    with stage("scan", bytes_in=sum(len(image) for image in images)), traced_peak("scan"):
+        return await _run_scan(images, email_list, phone, pdf_profile, set_stage)
+
+
 @router.post("/scan")
-@limiter.limit("3/minute")
 async def scan_form(
     request: Request,
     file: UploadFile = File(...),
     consent: str = Form(...),   # 🔥 FIX
     emails: str = Form(...),
     phone: str | None = Form(None),
+    pdf_profile: str = Form(PDF_PROFILE),
+    session_id: str | None = Form(None),
+    session_token: str | None = Form(None),
+    async_mode: bool = Query(False, alias="async"),
 ):
+    await limit_scan(request, session_id, session_token)
+
     if consent.lower() != "true":
         raise HTTPException(status_code=400, detail="Consent is required")
 
-    if not file.content_type or not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Invalid image file")
-
     email_list = [e.strip() for e in emails.split(",") if e.strip()]
     if not email_list:
         raise HTTPException(status_code=400, detail="At least one email required")
 
-    request_id = str(uuid4())
-    request_dir = BASE_TEMP_DIR / request_id
-    request_dir.mkdir(parents=True, exist_ok=True)
+    if pdf_profile not in PDF_PROFILES:
+        raise HTTPException(status_code=400, detail="Invalid PDF profile")
 
-    input_path = request_dir / "input.jpg"
-    processed_path = request_dir / "processed.jpg"
-    pdf_path = request_dir / "LiveScanForm.pdf"
+    # -----------------------------
+    # Read + validate image (streamed, magic-byte sniffed)
+    # -----------------------------
+    upload = await read_image_upload(file, MAX_FILE_SIZE)
 
-    email_sent = False
-    sms_token = None
-    sms_pin = None
-    download_url = None
+    return await submit_scan([upload], email_list, phone, pdf_profile, async_mode)
 
-    try:
-        # -----------------------------
-        # Read + validate image
-        # -----------------------------
-        contents = await file.read()
-        if len(contents) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=413, detail="File too large")
 
-        with open(input_path, "wb") as f:
-            f.write(contents)
+@router.post("/scan/batch")
+async def scan_batch(
+    request: Request,
+    files: list[UploadFile] = File(...),
+    consent: str = Form(...),
+    emails: str = Form(...),
+    phone: str | None = Form(None),
+    pdf_profile: str = Form(PDF_PROFILE),
+    session_id: str | None = Form(None),
+    session_token: str | None = Form(None),
+    async_mode: bool = Query(False, alias="async"),
+):
+    """Multi-page scan: N images -> one PDF, one email, one SMS."""
+    await limit_scan(request, session_id, session_token)
 
-        # -----------------------------
-        # IMAGE PROCESSING (CROP + DESKEW + ENHANCE)
-        # -----------------------------
-        shutil.copy(input_path, processed_path)
+    if consent.lower() != "true":
+        raise HTTPException(status_code=400, detail="Consent is required")
 
+    if len(files) > MAX_BATCH_PAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_PAGES} pages per scan"
+        )
 
-        # -----------------------------
-        # Generate PDF
-        # -----------------------------
-        generated_pdf = image_to_pdf(processed_path)
-        shutil.move(generated_pdf, pdf_path)
+    email_list = [e.strip() for e in emails.split(",") if e.strip()]
+    if not email_list:
+        raise HTTPException(status_code=400, detail="At least one email required")
 
-        if not pdf_path.exists():
-            raise RuntimeError("PDF generation failed")
+    if pdf_profile not in PDF_PROFILES:
+        raise HTTPException(status_code=400, detail="Invalid PDF profile")
 
-        # -----------------------------
-        # Send email
-        # -----------------------------
-        await asyncio.to_thread(
-            send_email_with_attachment,
-            to_emails=email_list,
-            pdf_path=pdf_path,
-        )
-        email_sent = True
+    uploads = [await read_image_upload(f, MAX_FILE_SIZE) for f in files]
 
-        # -----------------------------
-        # PHASE 2: SMS TOKEN + PIN
-        # -----------------------------
-        if phone:
-            sms_token, sms_pin = create_download_token(
-                file_path=str(pdf_path)
-            )
+    return await submit_scan(uploads, email_list, phone, pdf_profile, async_mode)
 
-            if not FRONTEND_BASE_URL:
-                raise RuntimeError("FRONTEND_BASE_URL not set")
 
-            download_url = f"{FRONTEND_BASE_URL}/download/{sms_token}"
+async def run_scan_job(
+    images: list[bytes],
+    email_list: list[str],
+    phone: str | None,
+    pdf_profile: str,
+    set_stage,
+):
+    """
+    run_scan for the job queue. Anyone holding the job_id can poll the
+    result, so it keeps the outcome and the download link only; the
+    PIN goes out by SMS and is never stored with the job.
+    """
+    result = await run_scan(images, email_list, phone, pdf_profile, set_stage)
+
+    return {
+        "status": result["status"],
+        "delivery": result["delivery"],
+        "pages": result["pages"],
+        "download_url": result["sms"]["download_url"],
+    }
 
-            send_sms(
-                phone=phone,
-                download_url=download_url,
-                pin=sms_pin,
-            )
 
-    except HTTPException:
-        raise
+async def submit_scan(
+    uploads,
+    email_list: list[str],
+    phone: str | None,
+    pdf_profile: str,
+    async_mode: bool,
+):
+    images = [upload.data for upload in uploads]
 
-    except Exception as e:
-        print("ERROR:", str(e))
+    if not async_mode:
+        return await run_scan(images, email_list, phone, pdf_profile)
+
+    # -----------------------------
+    # ASYNC MODE: enqueue + 202
+    # -----------------------------
+    # Hashed: the job store outlives the job and must not hold recipients
+    digests = "+".join(upload.sha256 for upload in uploads)
+    dedupe_key = hashlib.sha256(
+        f"{digests}:{','.join(email_list)}:{phone or ''}:{pdf_profile}".encode()
+    ).hexdigest()
+
+    try:
+        job = enqueue_job(
+            partial(run_scan_job, images, email_list, phone, pdf_profile),
+            dedupe_key=dedupe_key,
+            size=sum(len(image) for image in images),
+        )
+    except JobQueueFullError:
         raise HTTPException(
-            status_code=500,
-            detail="Failed to process scan"
+            status_code=503,
+            detail="Server is busy. Please try again shortly."
         )
 
-    finally:
-        # -----------------------------
-        # CLEANUP
-        # -----------------------------
-        # Always remove images
-        input_path.unlink(missing_ok=True)
-        processed_path.unlink(missing_ok=True)
+    return JSONResponse(
+        status_code=202,
+        content={
+            **job_status(job),
+            "status_url": f"/api/scan/{job['job_id']}",
+        },
+    )
 
-        # Remove entire folder ONLY if SMS is not enabled
-        if email_sent and not phone and request_dir.exists():
-            shutil.rmtree(request_dir, ignore_errors=True)
 
-    return {
-        "status": "success",
-        "sent_to": email_list,
-        "sms": {
-            "enabled": bool(phone),
-            "download_url": download_url,
-            "pin": sms_pin,
-        },
-    }
+@router.get("/scan/{job_id}")
+async def scan_job_status(job_id: str):
+    job = get_job(job_id)
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+
+    return job_status(job)
+
 
 
 
@@ -177,7 +380,6 @@ async def scan_form(
 # from slowapi import Limiter
 # from slowapi.util import get_remote_address
 
-# from app.services.image_processing import process_image
 # from app.services.pdf_service import image_to_pdf
 # from app.services.email_service import send_email_with_attachment
 
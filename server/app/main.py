@@ -2,17 +2,27 @@ import os
 import asyncio
 
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.middleware import SlowAPIMiddleware
-from slowapi.errors import RateLimitExceeded
-
-from app.utils.token_store import cleanup_expired_tokens
-from app.api.scan import router as scan_router
+from fastapi.responses import PlainTextResponse
+
+from app.utils.token_store import (
+    cleanup_expired_tokens,
+    on_expiry_scheduled,
+    seconds_until_next_expiry,
+)
+from app.utils.blob_store import sweep_blobs
+from app.services.pipeline import start_pipeline, shutdown_pipeline
+from app.services.warmup import warm_up
+from app.services.jobs import start_job_workers, stop_job_workers
+from app.services.outbox import start_outbox_workers, stop_outbox_workers
+from app.services.consent_log import start_consent_log, stop_consent_log
+from app.utils.r2 import shutdown_r2
+from app.utils.http import close_http_session
+from app.utils.circuit_breaker import breaker_states
+from app.utils.metrics import render_metrics, start_metrics_flusher, stop_metrics_flusher
+from app.utils.upload import BodySizeLimitMiddleware, MULTIPART_OVERHEAD
+from app.api.scan import router as scan_router, MAX_FILE_SIZE, MAX_BATCH_PAGES
 from app.api.download import router as download_router
 from app.api.init import router as init_router
 from app.api.consent import router as consent_router
@@ -39,24 +49,23 @@ app = FastAPI(title=APP_TITLE)
 
 
 # -----------------------------
-# RATE LIMITER
+# UPLOAD SIZE LIMIT (before multipart parsing)
 # -----------------------------
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
-app.add_middleware(SlowAPIMiddleware)
-
-
-@app.exception_handler(RateLimitExceeded)
-async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
-    return JSONResponse(
-        status_code=429,
-        content={"detail": "Too many requests. Please try again shortly."},
-    )
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={
+        "/api/scan": MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+        "/api/scan/batch": MAX_BATCH_PAGES * (MAX_FILE_SIZE + MULTIPART_OVERHEAD),
+    },
+)
 
 
 # -----------------------------
 # CORS (ENV-AWARE)
 # -----------------------------
+# The download page resumes interrupted downloads with Range / If-Range
+DOWNLOAD_EXPOSE_HEADERS = ["ETag", "Content-Range", "Content-Length", "Accept-Ranges", "Retry-After"]
+
 if ENV == "development":
     # ⚠️ Local dev only
     app.add_middleware(
@@ -64,6 +73,7 @@ if ENV == "development":
         allow_origins=["*"],
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=DOWNLOAD_EXPOSE_HEADERS,
     )
 else:
     # ✅ Production / staging
@@ -73,6 +83,7 @@ else:
         allow_credentials=True,
         allow_methods=["POST", "OPTIONS"],
         allow_headers=["*"],
+        expose_headers=DOWNLOAD_EXPOSE_HEADERS,
     )
 
 
@@ -89,11 +100,101 @@ app.include_router(download_router)
 def health():
     return {"status": "ok"}
 
+
+@app.get("/health/providers", tags=["health"])
+def provider_health():
+    """Circuit breaker state per external provider (this worker)."""
+    return breaker_states()
+
+
+@app.get("/metrics", tags=["health"], response_class=PlainTextResponse)
+def metrics():
+    """Per-stage latency, bytes, errors, in-flight and peak memory (Prometheus text format)."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.on_event("startup")
+async def start_metrics():
+    start_metrics_flusher()
+
+
+@app.on_event("shutdown")
+async def stop_metrics():
+    await stop_metrics_flusher()
+
+
 @app.on_event("startup")
 async def start_cleanup_task():
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+
+    # New tokens may move the next deadline; wake up to re-plan
+    on_expiry_scheduled(lambda _: loop.call_soon_threadsafe(wake.set))
+
+    # Blobs whose tokens were lost (restart, memory token store)
+    await sweep_blobs()
+
     async def cleanup_loop():
         while True:
-            cleanup_expired_tokens()
-            await asyncio.sleep(60)  # every 1 minute
+            wake.clear()
+            await cleanup_expired_tokens()
+
+            # Sleep until the next token expires (or forever if none)
+            try:
+                await asyncio.wait_for(wake.wait(), seconds_until_next_expiry())
+            except asyncio.TimeoutError:
+                pass
+
+    asyncio.create_task(cleanup_loop())
+
+@app.on_event("startup")
+async def start_scan_pipeline():
+    # Pre-spawn the image/PDF worker pool so the first scan doesn't pay for it
+    await start_pipeline()
+    start_job_workers()
+
+
+@app.on_event("startup")
+async def warm_up_worker():
+    # Synthetic scan + primed provider connections, before this worker
+    # takes traffic (a recycled gunicorn worker would otherwise spike)
+    await warm_up()
+
+
+@app.on_event("shutdown")
+async def stop_scan_pipeline():
+    stop_job_workers()
+    shutdown_pipeline()
+
+
+@app.on_event("startup")
+async def start_delivery_workers():
+    # Also picks up deliveries a previous run left unsent
+    start_outbox_workers()
+
+
+@app.on_event("shutdown")
+async def stop_delivery_workers():
+    stop_outbox_workers()
+
+
+@app.on_event("startup")
+async def start_consent_writer():
+    # Uploads records left in the local WAL by a previous run
+    await start_consent_log()
+
+
+@app.on_event("shutdown")
+async def stop_consent_writer():
+    await stop_consent_log()
+
+
+@app.on_event("shutdown")
+async def stop_r2_pool():
+    shutdown_r2()
+
+
 
-    asyncio.create_task(cleanup_loop())
\ No newline at end of file
+@app.on_event("shutdown")
+async def close_http_pool():
+    await close_http_session()
\ No newline at end of file
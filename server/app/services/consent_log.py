@@ -0,0 +1,307 @@
+import asyncio
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from uuid import uuid4
+
+from app.utils.r2 import R2_BUCKET, r2_call, upload_json_to_r2
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+# log     -> records buffered in a local WAL, flushed as gzip NDJSON segments
+# objects -> one pretty-printed JSON object per consent (one PUT each)
+CONSENT_STORAGE = os.getenv("CONSENT_STORAGE", "log")
+
+if CONSENT_STORAGE not in ("log", "objects"):
+    raise RuntimeError("CONSENT_STORAGE must be log or objects")
+
+CONSENT_LOG_PATH = os.getenv(
+    "CONSENT_LOG_PATH",
+    str(Path(tempfile.gettempdir()) / "live_scan_consent_log.db"),
+)
+CONSENT_LOG_PREFIX = os.getenv("CONSENT_LOG_PREFIX", "consents/log")
+
+# Flush when this much NDJSON is pending, or when the oldest record is this old
+CONSENT_SEGMENT_MAX_BYTES = int(os.getenv("CONSENT_SEGMENT_MAX_BYTES", 256 * 1024))
+CONSENT_SEGMENT_MAX_SECONDS = int(os.getenv("CONSENT_SEGMENT_MAX_SECONDS", 60))
+
+# Local lookup index for flushed records. Every segment has a sidecar
+# .index.json in R2, so older rows are dropped here (find_consents only
+# covers this window; older records are found through the sidecars)
+CONSENT_INDEX_RETENTION_SECONDS = int(os.getenv("CONSENT_INDEX_RETENTION_SECONDS", 7 * 24 * 3600))
+
+# A claimed segment this old was left behind by a failed upload or a dead worker
+_STALE_CLAIM_SECONDS = 300
+
+
+# -----------------------------
+# LOCAL WAL (shared by every worker on the host)
+# -----------------------------
+_local = threading.local()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(CONSENT_LOG_PATH, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Consent records are evidence; fsync every append
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                consent_type TEXT NOT NULL,
+                line TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                segment TEXT,
+                claimed_at REAL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS consent_index (
+                session_id TEXT NOT NULL,
+                consent_type TEXT NOT NULL,
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                indexed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS consent_index_session
+            ON consent_index (session_id)
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS consent_index_indexed_at
+            ON consent_index (indexed_at)
+        """)
+        _local.conn = conn
+    return conn
+
+
+def _append(session_id: str, consent_type: str, line: str) -> int:
+    """Durably queue one NDJSON line; returns the unflushed byte count."""
+    conn = _conn()
+    conn.execute(
+        "INSERT INTO pending (session_id, consent_type, line, created_at) VALUES (?, ?, ?, ?)",
+        (session_id, consent_type, line, time.time()),
+    )
+    return conn.execute(
+        "SELECT COALESCE(SUM(LENGTH(line) + 1), 0) FROM pending WHERE segment IS NULL"
+    ).fetchone()[0]
+
+
+def _claim(force: bool) -> list[str]:
+    """
+    Assign unflushed records to a new segment (one atomic UPDATE, so
+    workers never claim the same record) and return every segment
+    this caller should upload, including stale claims.
+    """
+    conn = _conn()
+    now = time.time()
+
+    oldest = conn.execute("SELECT MIN(created_at) FROM pending WHERE segment IS NULL").fetchone()[0]
+    due = oldest is not None and (force or now - oldest >= CONSENT_SEGMENT_MAX_SECONDS)
+
+    if not due:
+        size = conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(line) + 1), 0) FROM pending WHERE segment IS NULL"
+        ).fetchone()[0]
+        due = size >= CONSENT_SEGMENT_MAX_BYTES
+
+    if due:
+        segment_id = f"{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(now))}-{uuid4().hex[:12]}"
+        conn.execute(
+            "UPDATE pending SET segment = ?, claimed_at = ? WHERE segment IS NULL",
+            (f"{CONSENT_LOG_PREFIX}/{segment_id}.ndjson.gz", now),
+        )
+
+    stale_before = now if force else now - _STALE_CLAIM_SECONDS
+    rows = conn.execute(
+        """
+        SELECT DISTINCT segment FROM pending
+        WHERE segment IS NOT NULL AND (claimed_at <= ? OR claimed_at = ?)
+        """,
+        (stale_before, now),
+    ).fetchall()
+
+    return [row[0] for row in rows]
+
+
+def _build_segment(segment: str):
+    """Rebuild a claimed segment from the WAL (deterministic, so re-uploads are idempotent)."""
+    rows = _conn().execute(
+        "SELECT session_id, consent_type, line FROM pending WHERE segment = ? ORDER BY seq",
+        (segment,),
+    ).fetchall()
+
+    body = bytearray()
+    index = []
+
+    for session_id, consent_type, line in rows:
+        data = line.encode() + b"\n"
+        index.append((session_id, consent_type, segment, len(body), len(data)))
+        body += data
+
+    return gzip.compress(bytes(body), 6), index
+
+
+def _commit_segment(segment: str, index: list[tuple]):
+    conn = _conn()
+    now = time.time()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM consent_index WHERE segment = ?", (segment,))
+        conn.executemany(
+            "INSERT INTO consent_index (session_id, consent_type, segment, offset, length, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(*row, now) for row in index],
+        )
+        conn.execute("DELETE FROM pending WHERE segment = ?", (segment,))
+        conn.execute(
+            "DELETE FROM consent_index WHERE indexed_at < ?",
+            (now - CONSENT_INDEX_RETENTION_SECONDS,),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+# -----------------------------
+# FLUSHING
+# -----------------------------
+_wake: asyncio.Event | None = None
+_flusher: asyncio.Task | None = None
+
+
+async def _upload_segment(segment: str):
+    body, index = await asyncio.to_thread(_build_segment, segment)
+    if not index:
+        return
+
+    await r2_call(
+        "put_object",
+        Bucket=R2_BUCKET,
+        Key=segment,
+        Body=body,
+        ContentType="application/x-ndjson",
+    )
+
+    # Sidecar index so records stay findable without this host's WAL
+    sidecar = {}
+    for session_id, consent_type, _, offset, length in index:
+        sidecar.setdefault(session_id, []).append(
+            {"consent_type": consent_type, "offset": offset, "length": length}
+        )
+    await upload_json_to_r2(segment.removesuffix(".ndjson.gz") + ".index.json", sidecar)
+
+    await asyncio.to_thread(_commit_segment, segment, index)
+
+
+async def flush_consent_log(force: bool = False):
+    """Upload due segments. Failed uploads stay in the WAL for the next run."""
+    for segment in await asyncio.to_thread(_claim, force):
+        try:
+            await _upload_segment(segment)
+        except Exception as e:
+            print("ERROR: consent segment upload failed:", segment, str(e))
+
+
+async def _flush_loop():
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), CONSENT_SEGMENT_MAX_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+        _wake.clear()
+        await flush_consent_log()
+
+
+async def start_consent_log():
+    """Replay records a previous run didn't flush, then start the timer."""
+    global _wake, _flusher
+
+    if CONSENT_STORAGE != "log" or _flusher is not None:
+        return
+
+    _wake = asyncio.Event()
+    await flush_consent_log(force=True)
+    _flusher = asyncio.create_task(_flush_loop())
+
+
+async def stop_consent_log():
+    global _flusher
+
+    if _flusher is None:
+        return
+
+    _flusher.cancel()
+    _flusher = None
+    await flush_consent_log(force=True)
+
+
+# -----------------------------
+# PUBLIC API
+# -----------------------------
+async def record_consent(session_id: str, consent_type: str, consent: dict):
+    """
+    Persist a signed consent record. Returns once it is durable
+    (in the local WAL, or in R2 for CONSENT_STORAGE=objects).
+    """
+    if CONSENT_STORAGE == "objects":
+        key = f"consents/session_{session_id}/consent.{consent_type}.json"
+        await upload_json_to_r2(key, consent)
+        return
+
+    line = json.dumps(
+        {"session_id": session_id, "consent_type": consent_type, "consent": consent},
+        separators=(",", ":"),
+    )
+    pending_bytes = await asyncio.to_thread(_append, session_id, consent_type, line)
+
+    if pending_bytes >= CONSENT_SEGMENT_MAX_BYTES and _wake is not None:
+        _wake.set()
+
+
+async def find_consents(session_id: str) -> list[dict]:
+    """
+    A session's consent records, flushed or not (log storage). Flushed
+    records are only indexed here for CONSENT_INDEX_RETENTION_SECONDS.
+    """
+
+    def lookup():
+        conn = _conn()
+        flushed = conn.execute(
+            "SELECT segment, offset, length FROM consent_index WHERE session_id = ?",
+            (session_id,),
+        ).fetchall()
+        pending = conn.execute(
+            "SELECT line FROM pending WHERE session_id = ? ORDER BY seq",
+            (session_id,),
+        ).fetchall()
+        return flushed, pending
+
+    flushed, pending = await asyncio.to_thread(lookup)
+
+    segments = {}
+    for segment, _, _ in flushed:
+        if segment not in segments:
+            obj = await r2_call("get_object", Bucket=R2_BUCKET, Key=segment)
+            segments[segment] = gzip.decompress(await asyncio.to_thread(obj["Body"].read))
+
+    records = [
+        json.loads(segments[segment][offset:offset + length])
+        for segment, offset, length in flushed
+    ]
+    records.extend(json.loads(line) for (line,) in pending)
+
+    return records
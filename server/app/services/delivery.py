@@ -0,0 +1,45 @@
+import asyncio
+import os
+
+from app.utils.circuit_breaker import CircuitOpenError
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+# Budget per channel for the whole send (connect + retries + response)
+DELIVERY_TIMEOUTS = {
+    "email": float(os.getenv("EMAIL_DELIVERY_TIMEOUT_SECONDS", 30)),
+    "sms": float(os.getenv("SMS_DELIVERY_TIMEOUT_SECONDS", 15)),
+}
+
+
+async def _deliver(channel: str, send) -> dict:
+    try:
+        await asyncio.wait_for(send(), DELIVERY_TIMEOUTS[channel])
+
+    except CircuitOpenError as e:
+        print("ERROR:", channel, "delivery skipped:", str(e))
+        return {"status": "failed", "error": "unavailable"}
+
+    except asyncio.TimeoutError:
+        print("ERROR:", channel, "delivery timed out")
+        return {"status": "failed", "error": "timeout"}
+
+    except Exception as e:
+        print("ERROR:", channel, "delivery failed:", str(e))
+        return {"status": "failed", "error": "rejected"}
+
+    return {"status": "sent"}
+
+
+async def fan_out(sends: dict) -> dict[str, dict]:
+    """
+    Run every channel's send() concurrently, each under its own timeout.
+    Returns {channel: {"status": "sent"} or {"status": "failed", "error": ...}};
+    one channel failing never cancels the others.
+    """
+    results = await asyncio.gather(*(
+        _deliver(channel, send) for channel, send in sends.items()
+    ))
+
+    return dict(zip(sends, results))
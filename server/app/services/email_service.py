@@ -1,16 +1,17 @@
+import asyncio
 import base64
+import json
 import os
 from pathlib import Path
+from typing import NamedTuple
+
+import aiohttp
 from dotenv import load_dotenv
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import (
-    Mail,
-    Attachment,
-    FileContent,
-    FileName,
-    FileType,
-    Disposition,
-)
+
+from app.utils.circuit_breaker import ProviderRejectedError, get_breaker
+from app.utils.http import get_http_session
+from app.utils.metrics import stage
+from app.utils.providers import get_provider, register_provider
 
 # -----------------------------
 # Load environment variables
@@ -21,31 +22,14 @@ SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
 SENDGRID_FROM_EMAIL = os.getenv("SENDGRID_FROM_EMAIL")
 SENDGRID_FROM_NAME = os.getenv("SENDGRID_FROM_NAME", "The Loss Prevention Group, Inc.")
 
-if not SENDGRID_API_KEY:
-    raise RuntimeError("SENDGRID_API_KEY not set")
+# Point at a local stand-in for tests
+SENDGRID_API_BASE_URL = os.getenv("SENDGRID_API_BASE_URL", "https://api.sendgrid.com").rstrip("/")
+SENDGRID_TIMEOUT_SECONDS = float(os.getenv("SENDGRID_TIMEOUT_SECONDS", 15))
 
-if not SENDGRID_FROM_EMAIL:
-    raise RuntimeError("SENDGRID_FROM_EMAIL not set")
 
+SUBJECT = "Your Completed Request for Live Scan Service Form"
 
-def send_email_with_attachment(
-    to_emails: list[str],
-    pdf_path: Path,
-):
-    # -----------------------------
-    # Encode PDF
-    # -----------------------------
-    with open(pdf_path, "rb") as f:
-        encoded_pdf = base64.b64encode(f.read()).decode()
-
-    # -----------------------------
-    # Create email (MULTI-RECIPIENT)
-    # -----------------------------
-    message = Mail(
-        from_email=(SENDGRID_FROM_EMAIL, SENDGRID_FROM_NAME),
-        to_emails=to_emails,  # ✅ LIST OF EMAILS (THIS IS THE KEY CHANGE)
-        subject="Your Completed Request for Live Scan Service Form",
-        html_content = """
+HTML_CONTENT = """
 <p>Dear Customer,</p>
 
 <p>
@@ -76,26 +60,94 @@ unauthorized access resulting from the recipient’s email security settings,
 shared access, or forwarding of this message.
 </p>
 """
-,
+
+# -----------------------------
+# PREBUILT MESSAGE TEMPLATE (ON FIRST USE)
+# -----------------------------
+# The static part of the v3 mail/send body is serialized once; per message
+# only recipients, filename and the base64 attachment are spliced in, so
+# the (large) attachment never goes through json.dumps.
+class SendGridClient(NamedTuple):
+    message_head: bytes
+    headers: dict
+
+
+def _create_sendgrid_client() -> SendGridClient:
+    if not SENDGRID_API_KEY:
+        raise RuntimeError("SENDGRID_API_KEY not set")
+
+    if not SENDGRID_FROM_EMAIL:
+        raise RuntimeError("SENDGRID_FROM_EMAIL not set")
+
+    message_head = json.dumps({
+        "from": {"email": SENDGRID_FROM_EMAIL, "name": SENDGRID_FROM_NAME},
+        "subject": SUBJECT,
+        "content": [{"type": "text/html", "value": HTML_CONTENT}],
+    }).encode()[:-1]
+
+    return SendGridClient(
+        message_head=message_head,
+        headers={
+            "Authorization": f"Bearer {SENDGRID_API_KEY}",
+            "Content-Type": "application/json",
+        },
     )
 
+
+register_provider("sendgrid", _create_sendgrid_client)
+
+_BREAKER = get_breaker("sendgrid", SENDGRID_TIMEOUT_SECONDS)
+
+_SEND_URL = f"{SENDGRID_API_BASE_URL}/v3/mail/send"
+
+
+def build_message(to_emails: list[str], pdf_bytes: bytes, filename: str) -> bytes:
+    """Request body for one message to all recipients with the PDF attached."""
+    personalizations = json.dumps([{"to": [{"email": e} for e in to_emails]}]).encode()
+
+    return b"".join((
+        get_provider("sendgrid").message_head,
+        b', "personalizations": ', personalizations,
+        b', "attachments": [{"content": "', base64.b64encode(pdf_bytes),
+        b'", "filename": ', json.dumps(filename).encode(),
+        b', "type": "application/pdf", "disposition": "attachment"}]}',
+    ))
+
+
+async def send_email_with_attachment(
+    to_emails: list[str],
+    pdf_path: Path | None = None,
+    pdf_bytes: bytes | None = None,
+    filename: str = "LiveScanForm.pdf",
+):
     # -----------------------------
-    # Attach PDF
+    # Encode PDF (in-memory buffer preferred, disk as fallback)
     # -----------------------------
-    attachment = Attachment(
-        FileContent(encoded_pdf),
-        FileName(pdf_path.name),
-        FileType("application/pdf"),
-        Disposition("attachment"),
-    )
+    if pdf_bytes is None:
+        pdf_bytes = await asyncio.to_thread(Path(pdf_path).read_bytes)
+        filename = Path(pdf_path).name
 
-    message.attachment = attachment
+    body = build_message(to_emails, pdf_bytes, filename)
 
     # -----------------------------
-    # Send email
+    # Send email (pooled session, behind the SendGrid circuit breaker)
     # -----------------------------
-    sg = SendGridAPIClient(SENDGRID_API_KEY)
-    response = sg.send(message)
+    await _BREAKER.call(_post_message, body)
+
+
+async def _post_message(body: bytes):
+    with stage("sendgrid", bytes_out=len(body)):
+        async with get_http_session().post(
+            _SEND_URL,
+            data=body,
+            headers=get_provider("sendgrid").headers,
+            timeout=aiohttp.ClientTimeout(total=SENDGRID_TIMEOUT_SECONDS),
+        ) as response:
+            if response.status in (200, 202):
+                return
+
+            # 4xx: this message is bad, SendGrid itself is fine
+            if 400 <= response.status < 500 and response.status != 429:
+                raise ProviderRejectedError("SendGrid rejected email")
 
-    if response.status_code not in (200, 202):
-        raise Exception("SendGrid rejected email")
+            raise Exception("SendGrid rejected email")
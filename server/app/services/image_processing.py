@@ -1,7 +1,22 @@
-import cv2
-import numpy as np
+import os
 from pathlib import Path
 
+from app.services.pdf_writer import A4_POINTS
+from app.utils.metrics import stage
+from app.utils.providers import lazy_import
+
+# Loaded on first use; the web process mostly never touches them
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+# Long edge (px) of the pyramid level used for document detection.
+# 0 = detect on the full-resolution image.
+DETECT_MAX_EDGE = int(os.getenv("DETECT_MAX_EDGE", 800))
+
+# Effective resolution of the raster once placed on the PDF page.
+# 0 = keep the source resolution.
+PDF_TARGET_DPI = int(os.getenv("PDF_TARGET_DPI", 200))
+
 def order_points(pts):
     rect = np.zeros((4, 2), dtype="float32")
 
@@ -15,7 +30,36 @@ def order_points(pts):
 
     return rect
 
-def four_point_transform(image, pts):
+def fit_to_page(width, height, dpi=PDF_TARGET_DPI, page=A4_POINTS):
+    """
+    Pixel size at which an image fills the page (aspect ratio kept)
+    at `dpi`. Never upscales.
+    """
+    if not dpi:
+        return width, height
+
+    scale = min(
+        page[0] / 72 * dpi / width,
+        page[1] / 72 * dpi / height,
+        1.0,
+    )
+
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def resample_to_dpi(image, dpi=PDF_TARGET_DPI):
+    height, width = image.shape[:2]
+    size = fit_to_page(width, height, dpi)
+
+    if size == (width, height):
+        return image
+
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+def four_point_transform(image, pts, dpi=None):
+    """
+    Warp the quad to a flat rectangle. With `dpi`, the page-fit
+    downscale is folded into the homography so warp + resize is one pass.
+    """
     rect = order_points(pts)
     (tl, tr, br, bl) = rect
 
@@ -27,6 +71,9 @@ def four_point_transform(image, pts):
     heightB = np.linalg.norm(tl - bl)
     maxHeight = int(max(heightA, heightB))
 
+    if dpi:
+        maxWidth, maxHeight = fit_to_page(maxWidth, maxHeight, dpi)
+
     dst = np.array([
         [0, 0],
         [maxWidth - 1, 0],
@@ -38,13 +85,39 @@ def four_point_transform(image, pts):
 
     return warped
 
-def process_image(image_path: Path) -> Path:
-    image = cv2.imread(str(image_path))
-    if image is None:
-        return image_path
+def largest_contours(contours, k=5):
+    """Top-k contours by area, largest first, without sorting all of them."""
+    if len(contours) <= k:
+        return sorted(contours, key=cv2.contourArea, reverse=True)
+
+    areas = np.fromiter(
+        (cv2.contourArea(c) for c in contours),
+        dtype=np.float64,
+        count=len(contours),
+    )
+    top = np.argpartition(areas, -k)[-k:]
+    top = top[np.argsort(areas[top])[::-1]]
+
+    return [contours[i] for i in top]
+
+def find_document_quad(image, max_edge=DETECT_MAX_EDGE):
+    """
+    Find the four document corners on a downscaled copy of the image.
+    Returns the corners in full-resolution coordinates, or None.
+    """
+    height, width = image.shape[:2]
+    ratio = 1.0
 
-    orig = image.copy()
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    if max_edge and max(height, width) > max_edge:
+        ratio = max(height, width) / max_edge
+        gray = cv2.resize(
+            gray,
+            (round(width / ratio), round(height / ratio)),
+            interpolation=cv2.INTER_AREA,
+        )
+
     gray = cv2.GaussianBlur(gray, (5, 5), 0)
 
     edged = cv2.Canny(gray, 75, 200)
@@ -53,34 +126,53 @@ def process_image(image_path: Path) -> Path:
         edged, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE
     )
 
-    contours = sorted(contours, key=cv2.contourArea, reverse=True)[:5]
-
-    doc_cnt = None
-
-    for c in contours:
+    for c in largest_contours(contours, 5):
         peri = cv2.arcLength(c, True)
         approx = cv2.approxPolyDP(c, 0.02 * peri, True)
 
         if len(approx) == 4:
-            doc_cnt = approx
-            break
+            return approx.reshape(4, 2).astype("float32") * ratio
 
-    if doc_cnt is None:
-        # fallback – return original
-        return image_path
+    return None
+
+def enhance_document(image, max_edge=DETECT_MAX_EDGE, dpi=None):
+    """
+    Detect the document in a BGR image, deskew it and apply
+    adaptive thresholding. Returns None when no document is found.
+    """
+    with stage("detect"):
+        quad = find_document_quad(image, max_edge)
 
-    warped = four_point_transform(orig, doc_cnt.reshape(4, 2))
+    if quad is None:
+        return None
+
+    with stage("warp"):
+        warped = four_point_transform(image, quad, dpi)
 
     # Enhancement
-    warped_gray = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)
-    warped_gray = cv2.adaptiveThreshold(
-        warped_gray,
-        255,
-        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY,
-        11,
-        2,
-    )
+    with stage("threshold"):
+        warped_gray = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)
+        warped_gray = cv2.adaptiveThreshold(
+            warped_gray,
+            255,
+            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY,
+            11,
+            2,
+        )
+
+    return warped_gray
+
+def process_image(image_path: Path) -> Path:
+    image = cv2.imread(str(image_path))
+    if image is None:
+        return image_path
+
+    warped_gray = enhance_document(image)
+
+    if warped_gray is None:
+        # fallback – return original
+        return image_path
 
     output_path = image_path.parent / f"processed_{image_path.name}"
     cv2.imwrite(str(output_path), warped_gray)
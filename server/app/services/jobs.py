@@ -0,0 +1,316 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from uuid import uuid4
+
+from fastapi import HTTPException
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+SCAN_JOB_CONCURRENCY = int(os.getenv("SCAN_JOB_CONCURRENCY", 2))
+SCAN_JOB_QUEUE_SIZE = int(os.getenv("SCAN_JOB_QUEUE_SIZE", 100))
+# Queued and running jobs hold their uploads in memory (a batch is up to
+# 10 x 5 MB); new jobs are rejected once this much is held per worker
+SCAN_JOB_QUEUE_MAX_BYTES = int(os.getenv("SCAN_JOB_QUEUE_MAX_BYTES", 256 * 1024 * 1024))
+SCAN_JOB_TTL_SECONDS = int(os.getenv("SCAN_JOB_TTL_SECONDS", 3600))
+
+# Jobs run in the worker that accepted them, but the status poll can
+# land on any worker, so with several workers the records are shared.
+# memory -> per-process dict (single worker only)
+# sqlite -> shared WAL database, safe across gunicorn workers on one host
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+SCAN_JOB_STORE_BACKEND = os.getenv("SCAN_JOB_STORE_BACKEND", "sqlite" if WEB_CONCURRENCY > 1 else "memory")
+SCAN_JOB_STORE_PATH = os.getenv(
+    "SCAN_JOB_STORE_PATH",
+    str(Path(tempfile.gettempdir()) / "live_scan_jobs.db"),
+)
+
+
+class JobQueueFullError(RuntimeError):
+    pass
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _orphaned(job: dict) -> dict:
+    """A job whose worker exited (restart / recycle) before finishing it."""
+    if job["status"] in ("queued", "running") and not _alive(job["pid"]):
+        job = {**job, "status": "failed", "error": "Failed to process scan"}
+    return job
+
+
+class MemoryJobStore:
+    """Job records in a dict (insertion order == creation order)."""
+
+    def __init__(self):
+        self.jobs: dict[str, dict] = {}
+        self.dedupe: dict[str, str] = {}
+
+    def create(self, job: dict):
+        self.jobs[job["job_id"]] = job
+        if job["dedupe_key"]:
+            self.dedupe[job["dedupe_key"]] = job["job_id"]
+
+    def get(self, job_id: str) -> dict | None:
+        job = self.jobs.get(job_id)
+        return dict(job) if job else None
+
+    def find(self, dedupe_key: str) -> dict | None:
+        job_id = self.dedupe.get(dedupe_key)
+        return self.get(job_id) if job_id else None
+
+    def update(self, job_id: str, **fields):
+        if job_id in self.jobs:
+            self.jobs[job_id].update(fields)
+
+    def purge(self, cutoff: float):
+        while self.jobs:
+            job_id, job = next(iter(self.jobs.items()))
+            if job["created_at"] >= cutoff or job["status"] in ("queued", "running"):
+                break
+
+            del self.jobs[job_id]
+            if self.dedupe.get(job["dedupe_key"]) == job_id:
+                del self.dedupe[job["dedupe_key"]]
+
+
+class SqliteJobStore:
+    """Job records in a SQLite database in WAL mode, shared by every worker on the host."""
+
+    COLUMNS = ("job_id", "status", "stage", "created_at", "updated_at", "result", "error", "dedupe_key", "pid")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+
+        # gunicorn --preload creates this in the master; forked workers
+        # must open their own connections, not share the master's
+        os.register_at_fork(after_in_child=self._forget_connections)
+
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS scan_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    dedupe_key TEXT,
+                    pid INTEGER NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS scan_jobs_dedupe_key ON scan_jobs (dedupe_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS scan_jobs_created_at ON scan_jobs (created_at)")
+
+    def _forget_connections(self):
+        self.local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _job(self, row) -> dict | None:
+        if not row:
+            return None
+
+        job = dict(zip(self.COLUMNS, row))
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def create(self, job: dict):
+        values = {**job, "result": None}
+        self._conn().execute(
+            f"INSERT INTO scan_jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+            [values[column] for column in self.COLUMNS],
+        )
+
+    def get(self, job_id: str) -> dict | None:
+        return self._job(self._conn().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM scan_jobs WHERE job_id = ?",
+            (job_id,),
+        ).fetchone())
+
+    def find(self, dedupe_key: str) -> dict | None:
+        return self._job(self._conn().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM scan_jobs WHERE dedupe_key = ? ORDER BY created_at DESC LIMIT 1",
+            (dedupe_key,),
+        ).fetchone())
+
+    def update(self, job_id: str, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"]) if fields["result"] is not None else None
+
+        self._conn().execute(
+            f"UPDATE scan_jobs SET {', '.join(f'{column} = ?' for column in fields)} WHERE job_id = ?",
+            (*fields.values(), job_id),
+        )
+
+    def purge(self, cutoff: float):
+        self._conn().execute(
+            "DELETE FROM scan_jobs WHERE created_at < ? AND status NOT IN ('queued', 'running')",
+            (cutoff,),
+        )
+
+
+def _create_store():
+    if SCAN_JOB_STORE_BACKEND == "memory":
+        if WEB_CONCURRENCY > 1:
+            raise RuntimeError("SCAN_JOB_STORE_BACKEND=memory needs a single worker (WEB_CONCURRENCY=1)")
+        return MemoryJobStore()
+    if SCAN_JOB_STORE_BACKEND == "sqlite":
+        return SqliteJobStore(SCAN_JOB_STORE_PATH)
+    raise RuntimeError("SCAN_JOB_STORE_BACKEND must be memory or sqlite")
+
+
+store = _create_store()
+
+# (job_id, handler, size) for this worker's background workers; the handler
+# (and the uploads it holds) only ever lives in the accepting process
+_queue: asyncio.Queue | None = None
+_workers: list[asyncio.Task] = []
+
+# Upload bytes held by this worker's queued + running jobs
+_queued_bytes = 0
+
+
+def enqueue_job(handler, dedupe_key: str | None = None, size: int = 0) -> dict:
+    """
+    Queue `handler(set_stage)` for the background workers; `size` is
+    the upload bytes it holds. A job with the same dedupe_key that
+    hasn't failed is returned instead of queueing a duplicate (client
+    retries).
+    """
+    global _queued_bytes
+
+    _ensure_workers()
+    store.purge(time.time() - SCAN_JOB_TTL_SECONDS)
+
+    if dedupe_key:
+        existing = store.find(dedupe_key)
+        if existing:
+            existing = _orphaned(existing)
+            if existing["status"] != "failed":
+                return existing
+
+    now = time.time()
+    job = {
+        "job_id": str(uuid4()),
+        "status": "queued",
+        "stage": "queued",
+        "created_at": now,
+        "updated_at": now,
+        "result": None,
+        "error": None,
+        "dedupe_key": dedupe_key,
+        "pid": os.getpid(),
+    }
+
+    if _queued_bytes + size > SCAN_JOB_QUEUE_MAX_BYTES:
+        raise JobQueueFullError("Scan job queue is full")
+
+    try:
+        _queue.put_nowait((job["job_id"], handler, size))
+    except asyncio.QueueFull:
+        raise JobQueueFullError("Scan job queue is full")
+
+    _queued_bytes += size
+    store.create(job)
+    return job
+
+
+def get_job(job_id: str) -> dict | None:
+    job = store.get(job_id)
+    return _orphaned(job) if job else None
+
+
+def job_status(job: dict) -> dict:
+    """Public view of a job (no internals)."""
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "result": job["result"],
+        "error": job["error"],
+    }
+
+
+async def _run_job(job_id: str, handler):
+    def set_stage(stage: str):
+        store.update(job_id, stage=stage, updated_at=time.time())
+
+    store.update(job_id, status="running")
+    set_stage("started")
+
+    try:
+        result = await handler(set_stage)
+        store.update(job_id, status="succeeded", result=result, stage="done", updated_at=time.time())
+
+    except HTTPException as e:
+        store.update(job_id, status="failed", error=e.detail, updated_at=time.time())
+
+    except Exception as e:
+        print("ERROR:", str(e))
+        store.update(job_id, status="failed", error="Failed to process scan", updated_at=time.time())
+
+
+async def _worker():
+    global _queued_bytes
+
+    while True:
+        job_id, handler, size = await _queue.get()
+        try:
+            await _run_job(job_id, handler)
+        finally:
+            # Drop the uploads as soon as the job is done
+            handler = None
+            _queued_bytes -= size
+            _queue.task_done()
+
+
+def _ensure_workers():
+    global _queue
+
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=SCAN_JOB_QUEUE_SIZE)
+
+    if not _workers:
+        _workers.extend(
+            asyncio.create_task(_worker())
+            for _ in range(SCAN_JOB_CONCURRENCY)
+        )
+
+
+def start_job_workers():
+    _ensure_workers()
+
+
+def stop_job_workers():
+    global _queue, _queued_bytes
+
+    for task in _workers:
+        task.cancel()
+
+    _workers.clear()
+    _queue = None
+    _queued_bytes = 0
@@ -0,0 +1,306 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from app.services.email_service import send_email_with_attachment
+from app.services.sms_service import send_sms
+from app.utils.blob_store import delete_blob, get_blob
+from app.utils.circuit_breaker import CircuitOpenError
+from app.utils.token_store import get_token
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+# direct -> email/SMS are sent inside the scan request (errors -> 500)
+# outbox -> deliveries are journaled and sent by background workers
+DELIVERY_MODE = os.getenv("DELIVERY_MODE", "direct")
+
+if DELIVERY_MODE not in ("direct", "outbox"):
+    raise RuntimeError("DELIVERY_MODE must be direct or outbox")
+
+OUTBOX_PATH = os.getenv(
+    "OUTBOX_PATH",
+    str(Path(tempfile.gettempdir()) / "live_scan_outbox.db"),
+)
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 2))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 6))
+OUTBOX_BASE_DELAY_SECONDS = float(os.getenv("OUTBOX_BASE_DELAY_SECONDS", 2))
+OUTBOX_MAX_DELAY_SECONDS = float(os.getenv("OUTBOX_MAX_DELAY_SECONDS", 300))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", 5))
+
+# How long an email-only scan's PDF is kept for retries
+OUTBOX_BLOB_TTL_SECONDS = int(os.getenv("OUTBOX_BLOB_TTL_SECONDS", 24 * 3600))
+
+# A delivery still "sending" after this long belongs to a dead worker
+OUTBOX_STALE_SECONDS = float(os.getenv("OUTBOX_STALE_SECONDS", 120))
+
+# Delivered rows are deleted right away; dead letters (and anything else
+# left behind) are kept this long for inspection, then purged
+OUTBOX_RETENTION_SECONDS = int(os.getenv("OUTBOX_RETENTION_SECONDS", 7 * 24 * 3600))
+OUTBOX_SWEEP_SECONDS = float(os.getenv("OUTBOX_SWEEP_SECONDS", 3600))
+
+FRONTEND_BASE_URL = os.getenv("FRONTEND_BASE_URL")
+
+
+# -----------------------------
+# JOURNAL (SQLite, shared by every worker on the host)
+# -----------------------------
+_local = threading.local()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(OUTBOX_PATH, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                claimed_at REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS outbox_due
+            ON outbox (status, next_attempt_at)
+        """)
+        _local.conn = conn
+    return conn
+
+
+def _insert(deliveries: list[tuple[str, dict]]):
+    conn = _conn()
+    now = time.time()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "INSERT INTO outbox (channel, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+            [(channel, json.dumps(payload), now, now) for channel, payload in deliveries],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _claim():
+    """Atomically take the next due delivery (or None)."""
+    conn = _conn()
+    now = time.time()
+
+    # Replay deliveries whose worker died mid-send (crash / restart)
+    conn.execute(
+        "UPDATE outbox SET status = 'pending' WHERE status = 'sending' AND claimed_at < ?",
+        (now - OUTBOX_STALE_SECONDS,),
+    )
+
+    return conn.execute(
+        """
+        UPDATE outbox SET status = 'sending', claimed_at = ?
+        WHERE id = (
+            SELECT id FROM outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY next_attempt_at LIMIT 1
+        )
+        RETURNING id, channel, payload, attempts
+        """,
+        (now, now),
+    ).fetchone()
+
+
+def _succeeded(delivery_id: int):
+    _conn().execute("DELETE FROM outbox WHERE id = ?", (delivery_id,))
+
+
+def _failed(delivery_id: int, attempts: int, error: str) -> bool:
+    """Schedule a retry with jittered exponential backoff; True if dead-lettered."""
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        _conn().execute(
+            "UPDATE outbox SET status = 'dead', attempts = ?, last_error = ? WHERE id = ?",
+            (attempts, error, delivery_id),
+        )
+        return True
+
+    delay = min(OUTBOX_MAX_DELAY_SECONDS, OUTBOX_BASE_DELAY_SECONDS * 2 ** max(attempts - 1, 0))
+    delay *= random.uniform(0.5, 1.0)
+
+    _conn().execute(
+        """
+        UPDATE outbox SET status = 'pending', attempts = ?, last_error = ?, next_attempt_at = ?
+        WHERE id = ?
+        """,
+        (attempts, error, time.time() + delay, delivery_id),
+    )
+    return False
+
+
+def _sweep():
+    """Purge dead letters past retention (they hold phone numbers / email addresses)."""
+    _conn().execute(
+        "DELETE FROM outbox WHERE status = 'dead' AND created_at < ?",
+        (time.time() - OUTBOX_RETENTION_SECONDS,),
+    )
+
+
+def dead_letters() -> list[dict]:
+    """Deliveries that ran out of attempts (for inspection / manual replay)."""
+    rows = _conn().execute(
+        "SELECT id, channel, attempts, last_error, created_at FROM outbox WHERE status = 'dead' ORDER BY id"
+    ).fetchall()
+
+    return [
+        dict(zip(("id", "channel", "attempts", "last_error", "created_at"), row))
+        for row in rows
+    ]
+
+
+# -----------------------------
+# CHANNELS
+# -----------------------------
+async def _deliver_email(payload: dict):
+    pdf_bytes = await get_blob(payload["blob_key"])
+    if pdf_bytes is None:
+        raise RuntimeError("PDF no longer available")
+
+    await send_email_with_attachment(
+        to_emails=payload["to_emails"],
+        pdf_bytes=pdf_bytes,
+        filename=payload["filename"],
+    )
+
+
+async def _deliver_sms(payload: dict):
+    # Only the token id is journaled; the PIN stays in the token store
+    token_id = payload["token_id"]
+    record = get_token(token_id)
+    if record is None:
+        raise RuntimeError("Download link expired")
+
+    download_url = f"{FRONTEND_BASE_URL}/download/{token_id}"
+    pin = record["pin"]
+
+    await send_sms(phone=payload["phone"], download_url=download_url, pin=pin)
+
+
+CHANNELS = {
+    "email": _deliver_email,
+    "sms": _deliver_sms,
+}
+
+
+async def _finished(payload: dict):
+    # The PDF is only kept for the email when no download token owns it
+    if payload.get("discard_blob"):
+        await delete_blob(payload["blob_key"])
+
+
+# -----------------------------
+# WORKERS
+# -----------------------------
+_wake: asyncio.Event | None = None
+_workers: list[asyncio.Task] = []
+_in_flight: set[int] = set()
+_next_sweep = 0.0
+
+
+async def _deliver_next() -> bool:
+    claimed = await asyncio.to_thread(_claim)
+    if claimed is None:
+        return False
+
+    delivery_id, channel, payload, attempts = claimed
+    payload = json.loads(payload)
+    _in_flight.add(delivery_id)
+
+    try:
+        await CHANNELS[channel](payload)
+    except Exception as e:
+        _in_flight.discard(delivery_id)
+        print("ERROR: delivery failed:", channel, delivery_id, str(e))
+
+        # An open circuit never reached the provider; don't burn an attempt
+        if not isinstance(e, CircuitOpenError):
+            attempts += 1
+
+        dead = await asyncio.to_thread(_failed, delivery_id, attempts, str(e))
+        if dead:
+            await _finished(payload)
+        return True
+
+    _in_flight.discard(delivery_id)
+    await asyncio.to_thread(_succeeded, delivery_id)
+    await _finished(payload)
+    return True
+
+
+async def _worker():
+    global _next_sweep
+
+    while True:
+        try:
+            if await _deliver_next():
+                continue
+
+            # Idle: purge old dead letters (any worker, at most once per interval)
+            if time.time() >= _next_sweep:
+                _next_sweep = time.time() + OUTBOX_SWEEP_SECONDS
+                await asyncio.to_thread(_sweep)
+        except Exception as e:
+            print("ERROR: outbox worker:", str(e))
+
+        try:
+            await asyncio.wait_for(_wake.wait(), OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+
+
+def start_outbox_workers():
+    """Start draining the journal (this also replays a previous run's backlog)."""
+    global _wake
+
+    if DELIVERY_MODE != "outbox" or _workers:
+        return
+
+    _wake = asyncio.Event()
+    _workers.extend(
+        asyncio.create_task(_worker())
+        for _ in range(OUTBOX_WORKERS)
+    )
+
+
+def stop_outbox_workers():
+    for task in _workers:
+        task.cancel()
+
+    _workers.clear()
+
+    # Interrupted sends go back to the queue for the next start
+    if _in_flight:
+        _conn().executemany(
+            "UPDATE outbox SET status = 'pending' WHERE id = ? AND status = 'sending'",
+            [(delivery_id,) for delivery_id in _in_flight],
+        )
+        _in_flight.clear()
+
+
+async def enqueue_deliveries(deliveries: list[tuple[str, dict]]):
+    """Durably journal (channel, payload) deliveries in one transaction."""
+    await asyncio.to_thread(_insert, deliveries)
+
+    if _wake is not None:
+        _wake.set()
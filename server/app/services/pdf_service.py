@@ -1,20 +1,55 @@
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
-from pathlib import Path
+import os
+import zlib
+from io import BytesIO
 
+from app.services.image_processing import PDF_TARGET_DPI, fit_to_page, resample_to_dpi
+from app.services.pdf_writer import A4_POINTS, PdfImage, flate_image, jpeg_image, jpeg_info, jpeg_orientation, png_image, write_image_pdf
+from app.utils.providers import lazy_import
 
-def image_to_pdf(image_path: Path) -> Path:
-    """
-    Convert a processed image to a single-page A4 PDF.
-    Returns the PDF file path.
-    """
-    pdf_path = image_path.parent / f"{image_path.stem}.pdf"
+# Loaded on first use; the web process mostly never touches them
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+canvas = lazy_import("reportlab.pdfgen.canvas")
+pagesizes = lazy_import("reportlab.lib.pagesizes")
+rl_utils = lazy_import("reportlab.lib.utils")
+
+# -----------------------------
+# COMPRESSION PROFILES
+# -----------------------------
+# auto              -> bilevel_g4 for thresholded pages, color_passthrough otherwise
+# bilevel_g4        -> 1-bit CCITT Group 4
+# gray_jpeg         -> 8-bit grayscale JPEG at PDF_JPEG_QUALITY
+# color_passthrough -> uploaded JPEG embedded as-is (no decode / re-encode)
+#                      when it is upright (no EXIF rotation) and already
+#                      within PDF_TARGET_DPI on the page
+PDF_PROFILES = ("auto", "bilevel_g4", "gray_jpeg", "color_passthrough")
+PDF_PROFILE = os.getenv("PDF_PROFILE", "auto")
+PDF_JPEG_QUALITY = int(os.getenv("PDF_JPEG_QUALITY", 75))
+
+if PDF_PROFILE not in PDF_PROFILES:
+    raise RuntimeError(f"PDF_PROFILE must be one of {', '.join(PDF_PROFILES)}")
+
+# native    -> app.services.pdf_writer (streams copied as-is)
+# reportlab -> ReportLab canvas; fallback, no CCITT / PNG passthrough
+PDF_ENGINE = os.getenv("PDF_ENGINE", "native")
+
+if PDF_ENGINE not in ("native", "reportlab"):
+    raise RuntimeError("PDF_ENGINE must be native or reportlab")
+
+# Attachment / download name of every generated PDF
+PDF_FILENAME = "LiveScanForm.pdf"
 
-    c = canvas.Canvas(str(pdf_path), pagesize=A4)
-    width, height = A4
 
-    img = ImageReader(str(image_path))
+def _reduced_decode(gray: bool):
+    # libjpeg can decode straight to 1/2, 1/4 or 1/8 scale
+    if gray:
+        return ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8), (4, cv2.IMREAD_REDUCED_GRAYSCALE_4), (2, cv2.IMREAD_REDUCED_GRAYSCALE_2))
+    return ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def _draw_page(c, img):
+    width, height = pagesizes.A4
     img_width, img_height = img.getSize()
 
     # Maintain aspect ratio
@@ -36,6 +71,151 @@ def image_to_pdf(image_path: Path) -> Path:
     )
 
     c.showPage()
+
+
+# -----------------------------
+# PROFILE ENCODERS
+# -----------------------------
+def encode_jpeg(image, quality: int = PDF_JPEG_QUALITY) -> PdfImage:
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+
+    height, width = image.shape[:2]
+    color_space = "DeviceGray" if image.ndim == 2 else "DeviceRGB"
+
+    return PdfImage(encoded.tobytes(), width, height, color_space, 8, "DCTDecode")
+
+
+def encode_g4(gray) -> PdfImage:
+    """1-bit CCITT Group 4 stream from a grayscale image (thresholded at 128)."""
+    height, width = gray.shape[:2]
+    bilevel = Image.fromarray(gray).point(lambda v: 255 if v >= 128 else 0, mode="1")
+
+    tiff = BytesIO()
+    bilevel.save(
+        tiff,
+        "TIFF",
+        compression="group4",
+        strip_size=(width + 7) // 8 * height,  # single strip
+    )
+
+    tiff.seek(0)
+    with Image.open(tiff) as parsed:
+        offset = parsed.tag_v2[273][0]
+        length = parsed.tag_v2[279][0]
+
+    data = tiff.getbuffer()[offset:offset + length].tobytes()
+
+    return PdfImage(
+        data, width, height, "DeviceGray", 1, "CCITTFaxDecode",
+        {"K": -1, "Columns": width, "Rows": height, "BlackIs1": "true"},
+    )
+
+
+def decode_for_page(source: bytes, gray: bool, dpi: int = PDF_TARGET_DPI):
+    """
+    Decode an upload at the page's effective resolution. JPEGs are
+    decoded at a reduced DCT scale where possible, then area-resampled.
+    """
+    flags = cv2.IMREAD_GRAYSCALE if gray else cv2.IMREAD_COLOR
+    info = jpeg_info(source)
+
+    if dpi and info:
+        width, height, _ = info
+        # EXIF rotation may swap the axes; size for whichever fit is larger
+        scale = max(
+            fit_to_page(width, height, dpi)[0] / width,
+            fit_to_page(height, width, dpi)[0] / height,
+        )
+        for factor, reduced_flags in _reduced_decode(gray):
+            if scale * factor <= 1:
+                flags = reduced_flags
+                break
+
+    image = cv2.imdecode(np.frombuffer(source, np.uint8), flags)
+    if image is None:
+        raise ValueError("Could not decode image")
+
+    return resample_to_dpi(image, dpi)
+
+
+def encode_page(
+    source: bytes,
+    image=None,
+    profile: str = PDF_PROFILE,
+    dpi: int = PDF_TARGET_DPI,
+) -> PdfImage:
+    """
+    Encode one page with a compression profile, resampled to `dpi`.
+
+    `source` is the uploaded file; `image` is the processed raster
+    (BGR or grayscale ndarray) when the enhancement stage produced one.
+    """
+    if profile == "auto":
+        bilevel = image is not None and image.ndim == 2
+        profile = "bilevel_g4" if bilevel else "color_passthrough"
+
+    if image is not None:
+        image = resample_to_dpi(image, dpi)
+
+    if profile == "color_passthrough":
+        if image is None:
+            page = jpeg_image(source)
+            if page is None and PDF_ENGINE == "native":
+                page = png_image(source)
+
+            # A rotated photo (EXIF) is decoded upright like larger ones,
+            # the raw stream would be embedded sideways
+            upright = jpeg_orientation(source) == 1
+            if page and upright and fit_to_page(page.width, page.height, dpi) == (page.width, page.height):
+                return page
+
+            image = decode_for_page(source, gray=False, dpi=dpi)
+        return encode_jpeg(image)
+
+    if image is None:
+        image = decode_for_page(source, gray=True, dpi=dpi)
+    elif image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    if profile == "gray_jpeg":
+        return encode_jpeg(image)
+
+    if profile == "bilevel_g4":
+        if PDF_ENGINE == "reportlab":
+            # ReportLab can't carry a CCITT stream
+            _, bilevel = cv2.threshold(image, 127, 255, cv2.THRESH_BINARY)
+            return flate_image(bilevel.tobytes(), bilevel.shape[1], bilevel.shape[0], "DeviceGray")
+        return encode_g4(image)
+
+    raise ValueError(f"Unknown PDF profile: {profile}")
+
+
+# -----------------------------
+# DOCUMENT ASSEMBLY
+# -----------------------------
+def _reportlab_image(page: PdfImage) -> "rl_utils.ImageReader":
+    if page.filter == "DCTDecode":
+        return rl_utils.ImageReader(BytesIO(page.data))
+
+    if page.filter == "FlateDecode" and not page.decode_parms:
+        mode = "L" if page.color_space == "DeviceGray" else "RGB"
+        return rl_utils.ImageReader(Image.frombytes(mode, (page.width, page.height), zlib.decompress(page.data)))
+
+    raise ValueError(f"ReportLab engine can't embed {page.filter} pages")
+
+
+def pages_to_pdf(pages: list[PdfImage]) -> bytes:
+    """Assemble encoded pages into one A4 PDF with the configured engine."""
+    if PDF_ENGINE == "native":
+        return write_image_pdf(pages, A4_POINTS)
+
+    buffer = BytesIO()
+
+    c = canvas.Canvas(buffer, pagesize=pagesizes.A4)
+    for page in pages:
+        _draw_page(c, _reportlab_image(page))
     c.save()
 
-    return pdf_path
+    return buffer.getvalue()
@@ -0,0 +1,267 @@
+"""
+Minimal PDF writer for image-only documents: one image per page,
+centred on the page with its aspect ratio kept.
+
+Encoded streams (JPEG, PNG/zlib, CCITT G4) are copied into the file
+as-is. Standard library only, so importing it costs next to nothing.
+"""
+import zlib
+from io import BytesIO
+from typing import NamedTuple
+
+A4_POINTS = (595.2756, 841.8898)
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, ...)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_JPEG_COLOR_SPACES = {1: "DeviceGray", 3: "DeviceRGB", 4: "DeviceCMYK"}
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_COLOR_SPACES = {0: ("DeviceGray", 1), 2: ("DeviceRGB", 3)}
+
+
+class PdfImage(NamedTuple):
+    """An already-encoded image stream, ready to embed as an XObject."""
+    data: bytes
+    width: int
+    height: int
+    color_space: str
+    bits: int
+    filter: str
+    decode_parms: dict | None = None
+
+
+# -----------------------------
+# STREAM PASSTHROUGH
+# -----------------------------
+def jpeg_info(data: bytes) -> tuple[int, int, int] | None:
+    """(width, height, components) from a JPEG header, without decoding."""
+    if data[:2] != b"\xff\xd8":
+        return None
+
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+
+        length = int.from_bytes(data[i + 2:i + 4], "big")
+        if marker in _JPEG_SOF_MARKERS and i + 10 <= len(data):
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height, data[i + 9]
+
+        i += 2 + length
+
+    return None
+
+
+def jpeg_orientation(data: bytes) -> int:
+    """
+    The EXIF Orientation tag (1-8) from a JPEG's APP1 segment, without
+    decoding; 1 (upright) when there is none.
+    """
+    if data[:2] != b"\xff\xd8":
+        return 1
+
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return 1
+
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        # Start of scan: metadata segments all come before it
+        if marker == 0xDA:
+            return 1
+
+        length = int.from_bytes(data[i + 2:i + 4], "big")
+        segment = data[i + 4:i + 2 + length]
+        if marker == 0xE1 and segment[:6] == b"Exif\x00\x00":
+            return _tiff_orientation(segment[6:])
+
+        i += 2 + length
+
+    return 1
+
+
+def _tiff_orientation(tiff: bytes) -> int:
+    order = {b"II": "little", b"MM": "big"}.get(tiff[:2])
+    if order is None or len(tiff) < 8:
+        return 1
+
+    ifd = int.from_bytes(tiff[4:8], order)
+    if ifd + 2 > len(tiff):
+        return 1
+
+    for n in range(int.from_bytes(tiff[ifd:ifd + 2], order)):
+        entry = tiff[ifd + 2 + 12 * n:ifd + 14 + 12 * n]
+        # 0x0112 Orientation, type SHORT
+        if len(entry) == 12 and int.from_bytes(entry[0:2], order) == 0x0112:
+            value = int.from_bytes(entry[8:10], order)
+            return value if 1 <= value <= 8 else 1
+
+    return 1
+
+
+def jpeg_image(data: bytes) -> PdfImage | None:
+    """Embed a JPEG as a DCTDecode stream, or None if it can't be."""
+    info = jpeg_info(data)
+    if not info or info[2] not in _JPEG_COLOR_SPACES:
+        return None
+
+    width, height, components = info
+    return PdfImage(bytes(data), width, height, _JPEG_COLOR_SPACES[components], 8, "DCTDecode")
+
+
+def png_image(data: bytes) -> PdfImage | None:
+    """
+    Embed a PNG's IDAT zlib stream as FlateDecode with PNG predictors.
+    Only 8-bit, non-interlaced grayscale/RGB PNGs qualify (no alpha,
+    no palette); anything else returns None.
+    """
+    if data[:8] != _PNG_SIGNATURE:
+        return None
+
+    idat = []
+    header = None
+    i = 8
+
+    while i + 8 <= len(data):
+        length = int.from_bytes(data[i:i + 4], "big")
+        kind = data[i + 4:i + 8]
+        body = data[i + 8:i + 8 + length]
+
+        if kind == b"IHDR":
+            header = body
+        elif kind == b"IDAT":
+            idat.append(body)
+        elif kind == b"IEND":
+            break
+
+        i += 12 + length
+
+    if not header or not idat:
+        return None
+
+    width = int.from_bytes(header[0:4], "big")
+    height = int.from_bytes(header[4:8], "big")
+    bit_depth, color_type, interlace = header[8], header[9], header[12]
+
+    if bit_depth != 8 or interlace or color_type not in _PNG_COLOR_SPACES:
+        return None
+
+    color_space, colors = _PNG_COLOR_SPACES[color_type]
+
+    return PdfImage(
+        b"".join(idat), width, height, color_space, 8, "FlateDecode",
+        {"Predictor": 15, "Colors": colors, "BitsPerComponent": 8, "Columns": width},
+    )
+
+
+def flate_image(pixels: bytes, width: int, height: int, color_space: str) -> PdfImage:
+    """Embed raw 8-bit gray/RGB pixels as a FlateDecode stream."""
+    return PdfImage(zlib.compress(pixels, 6), width, height, color_space, 8, "FlateDecode")
+
+
+# -----------------------------
+# WRITER
+# -----------------------------
+def _pdf_value(value) -> str:
+    if isinstance(value, dict):
+        return "<< " + " ".join(f"/{k} {_pdf_value(v)}" for k, v in value.items()) + " >>"
+    return str(value)
+
+
+def write_image_pdf(pages: list[PdfImage], page_size=A4_POINTS) -> bytes:
+    """
+    Write one page per pre-encoded image straight into a byte buffer:
+    catalog, page tree, per page an image XObject + content stream,
+    then the xref table.
+    """
+    page_width, page_height = page_size
+    objects: list[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    add(b"<< /Type /Catalog /Pages 2 0 R >>")
+    add(b"")  # page tree, filled in once the kids are known
+
+    kids = []
+    for page in pages:
+        image_dict = {
+            "Type": "/XObject",
+            "Subtype": "/Image",
+            "Width": page.width,
+            "Height": page.height,
+            "ColorSpace": f"/{page.color_space}",
+            "BitsPerComponent": page.bits,
+            "Filter": f"/{page.filter}",
+            "Length": len(page.data),
+        }
+        if page.decode_parms:
+            image_dict["DecodeParms"] = page.decode_parms
+        if page.color_space == "DeviceCMYK":
+            image_dict["Decode"] = "[1 0 1 0 1 0 1 0]"
+
+        image_ref = add(
+            _pdf_value(image_dict).encode()
+            + b"\nstream\n" + page.data + b"\nendstream"
+        )
+
+        # Maintain aspect ratio, centred on the page
+        scale = min(page_width / page.width, page_height / page.height)
+        width = page.width * scale
+        height = page.height * scale
+        x = (page_width - width) / 2
+        y = (page_height - height) / 2
+
+        content = f"q {width:.4f} 0 0 {height:.4f} {x:.4f} {y:.4f} cm /Im0 Do Q".encode()
+        content_ref = add(
+            f"<< /Length {len(content)} >>\nstream\n".encode()
+            + content + b"\nendstream"
+        )
+
+        kids.append(add(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.4f} {page_height:.4f}] "
+            f"/Resources << /XObject << /Im0 {image_ref} 0 R >> >> "
+            f"/Contents {content_ref} 0 R >>".encode()
+        ))
+
+    objects[1] = (
+        f"<< /Type /Pages /Count {len(kids)} /Kids ["
+        + " ".join(f"{ref} 0 R" for ref in kids)
+        + "] >>"
+    ).encode()
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n".encode()
+    )
+
+    return out.getvalue()
@@ -0,0 +1,250 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from app.services.image_processing import PDF_TARGET_DPI, enhance_document
+from app.services.pdf_service import PDF_PROFILE, PdfImage, encode_page, pages_to_pdf
+from app.utils.metrics import collect_stages, record_collected, stage
+from app.utils.providers import lazy_import
+
+# Loaded on first use; only the pool processes need them
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+# gunicorn workers on this host (gunicorn.conf.py exports it); each
+# one has its own pool, so the cores are split between them
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+
+PIPELINE_WORKERS = int(os.getenv(
+    "PIPELINE_WORKERS",
+    max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY),
+))
+
+# OpenCV threads per pool process: whatever cores are left over, so
+# the host isn't oversubscribed
+CV2_THREADS = int(os.getenv(
+    "CV2_THREADS",
+    max(1, (os.cpu_count() or 1) // (WEB_CONCURRENCY * PIPELINE_WORKERS)),
+))
+
+# Pages allowed to wait or run in the pool before new scans are
+# rejected. A batch is admitted whole, so this is also the largest
+# batch one worker can take (MAX_BATCH_PAGES is clamped to it); the
+# default leaves room for one full default batch (10 pages)
+PIPELINE_MAX_QUEUE = int(os.getenv("PIPELINE_MAX_QUEUE", max(PIPELINE_WORKERS * 4, 10)))
+
+# Crop + deskew + threshold stage (process_image) is opt-in
+SCAN_ENHANCE = os.getenv("SCAN_ENHANCE", "false").lower() == "true"
+
+# Run a synthetic scan through every pool process at startup
+PIPELINE_WARMUP = os.getenv("PIPELINE_WARMUP", "true").lower() == "true"
+
+
+class PipelineBusyError(RuntimeError):
+    pass
+
+
+_executor: ProcessPoolExecutor | None = None
+
+# Pages admitted (queued or running) in the pool; only touched on the loop
+_queued = 0
+
+
+# -----------------------------
+# WORKER SIDE (runs in child processes)
+# -----------------------------
+def _init_worker():
+    cv2.setNumThreads(CV2_THREADS)
+
+
+def _warm_up() -> int:
+    return os.getpid()
+
+
+def _synthetic_scan() -> bytes:
+    """A page-on-a-desk photo (JPEG) that goes through every stage."""
+    image = np.full((1200, 900, 3), 90, np.uint8)
+    page = np.array([[120, 100], [780, 140], [800, 1100], [90, 1060]], np.int32)
+    cv2.fillConvexPoly(image, page, (235, 235, 235))
+
+    for y in range(250, 1000, 60):
+        cv2.line(image, (200, y), (700, y), (30, 30, 30), 3)
+
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+def _warm_up_pipeline(profile: str) -> PdfImage:
+    """Load OpenCV, PIL and the PDF engine and run each code path once."""
+    image = _synthetic_scan()
+    page = prepare_page(image, True, profile)
+    pages_to_pdf([page, prepare_page(image, False, profile)])
+    return page
+
+
+def prepare_page(
+    image_bytes: bytes,
+    enhance: bool = SCAN_ENHANCE,
+    profile: str = PDF_PROFILE,
+) -> PdfImage:
+    """
+    Decode -> detect -> warp -> threshold for one page, then encode it
+    with the PDF compression profile.
+    """
+    processed = None
+
+    if enhance:
+        with stage("decode", bytes_in=len(image_bytes)):
+            image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+        if image is not None:
+            processed = enhance_document(image, dpi=PDF_TARGET_DPI)
+
+    with stage("encode", bytes_in=len(image_bytes)) as timed:
+        page = encode_page(image_bytes, processed, profile)
+        timed.bytes_out = len(page.data)
+
+    return page
+
+
+def render_pages(pages: list[PdfImage]) -> bytes:
+    """Assemble already encoded pages into one PDF."""
+    with stage("pdf", bytes_in=sum(len(page.data) for page in pages)) as timed:
+        pdf = pages_to_pdf(pages)
+        timed.bytes_out = len(pdf)
+
+    return pdf
+
+
+def render_scan(
+    image_bytes: bytes,
+    enhance: bool = SCAN_ENHANCE,
+    profile: str = PDF_PROFILE,
+) -> bytes:
+    """
+    Full decode -> detect -> warp -> threshold -> PDF chain.
+    Takes the uploaded image bytes and returns the PDF bytes.
+    """
+    return render_pages([prepare_page(image_bytes, enhance, profile)])
+
+
+# -----------------------------
+# LOOP SIDE
+# -----------------------------
+async def start_pipeline():
+    """Create the process pool and make sure every worker is spawned."""
+    global _executor
+
+    if _executor is not None:
+        return
+
+    _executor = ProcessPoolExecutor(
+        max_workers=PIPELINE_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(
+        loop.run_in_executor(_executor, _warm_up)
+        for _ in range(PIPELINE_WORKERS)
+    ))
+
+
+async def warm_up_pipeline():
+    """
+    One synthetic scan per pool process (each takes long enough cold
+    that idle processes share them out), then one multi-page stitch
+    here, like render_batch does.
+    """
+    if not PIPELINE_WARMUP:
+        return
+
+    if _executor is None:
+        await start_pipeline()
+
+    loop = asyncio.get_running_loop()
+    pages = await asyncio.gather(*(
+        loop.run_in_executor(_executor, _warm_up_pipeline, PDF_PROFILE)
+        for _ in range(PIPELINE_WORKERS)
+    ))
+
+    # Not render_pages: warm-up renders stay out of the stage metrics
+    pages_to_pdf(pages[:2])
+
+
+def shutdown_pipeline():
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+
+    _executor = None
+
+
+@contextmanager
+def _admit(pages: int):
+    """
+    Reserve queue room for `pages` at once, so a batch is admitted or
+    rejected as a whole. Raises PipelineBusyError when it doesn't fit.
+    """
+    global _queued
+
+    if _queued + pages > PIPELINE_MAX_QUEUE:
+        raise PipelineBusyError("Scan pipeline queue is full")
+
+    _queued += pages
+    try:
+        yield
+    finally:
+        _queued -= pages
+
+
+async def _submit(fn, *args):
+    loop = asyncio.get_running_loop()
+    result, samples, peak = await loop.run_in_executor(_executor, collect_stages, fn, *args)
+
+    record_collected(fn.__name__, samples, peak)
+    return result
+
+
+async def run_in_pipeline(fn, *args):
+    """
+    Run a CPU-bound function in the process pool, recording the
+    stages it timed there. Raises PipelineBusyError when the queue is
+    full.
+    """
+    if _executor is None:
+        await start_pipeline()
+
+    with _admit(1):
+        return await _submit(fn, *args)
+
+
+async def render_batch(images: list[bytes], profile: str = PDF_PROFILE) -> bytes:
+    """Prepare pages in parallel across the pool, then build one PDF."""
+    if len(images) == 1:
+        return await run_in_pipeline(render_scan, images[0], SCAN_ENHANCE, profile)
+
+    if _executor is None:
+        await start_pipeline()
+
+    with _admit(len(images)):
+        tasks = [
+            asyncio.ensure_future(_submit(prepare_page, image, SCAN_ENHANCE, profile))
+            for image in images
+        ]
+        try:
+            pages = await asyncio.gather(*tasks)
+        finally:
+            # One page failed (or the request went away): drop the
+            # pages that haven't started yet instead of rendering them
+            for task in tasks:
+                task.cancel()
+
+    # Only stitches encoded streams together; cheaper than shipping
+    # every page back into a worker
+    return render_pages(list(pages))
@@ -1,17 +1,43 @@
 import os
-from twilio.rest import Client
+from typing import NamedTuple
+
+import aiohttp
+
+from app.utils.circuit_breaker import ProviderRejectedError, get_breaker
+from app.utils.http import get_http_session
+from app.utils.metrics import stage
+from app.utils.providers import get_provider, register_provider
 
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_FROM_NUMBER = os.getenv("TWILIO_FROM_NUMBER")
 
-if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM_NUMBER]):
-    raise RuntimeError("Twilio environment variables not set")
+# Point at a local stand-in for tests
+TWILIO_API_BASE_URL = os.getenv("TWILIO_API_BASE_URL", "https://api.twilio.com").rstrip("/")
+TWILIO_TIMEOUT_SECONDS = float(os.getenv("TWILIO_TIMEOUT_SECONDS", 10))
+
+
+class TwilioClient(NamedTuple):
+    messages_url: str
+    auth: aiohttp.BasicAuth
+
+
+def _create_twilio_client() -> TwilioClient:
+    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM_NUMBER]):
+        raise RuntimeError("Twilio environment variables not set")
+
+    return TwilioClient(
+        messages_url=f"{TWILIO_API_BASE_URL}/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json",
+        auth=aiohttp.BasicAuth(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
+    )
+
 
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+register_provider("twilio", _create_twilio_client)
 
+_BREAKER = get_breaker("twilio", TWILIO_TIMEOUT_SECONDS)
 
-def send_sms(phone: str, download_url: str, pin: str, expiry_minutes: int = 60):
+
+async def send_sms(phone: str, download_url: str, pin: str, expiry_minutes: int = 60):
     message_body = (
     "LPG Live Scan\n"
     "Your Live Scan form from The Loss Prevention Group, Inc. is ready.\n\n"
@@ -22,11 +48,28 @@ def send_sms(phone: str, download_url: str, pin: str, expiry_minutes: int = 60):
     "Reply STOP to opt out."
 )
 
+    # Resolved before the breaker: missing settings aren't an outage
+    client = get_provider("twilio")
+    return await _BREAKER.call(_create_message, client, phone, message_body)
 
-    message = client.messages.create(
-        body=message_body,
-        from_=TWILIO_FROM_NUMBER,
-        to=phone,
-    )
 
-    return message.sid
+async def _create_message(client: TwilioClient, phone: str, message_body: str) -> str:
+    # Messages resource of the REST API, on the shared pooled session
+    with stage("twilio", bytes_out=len(message_body.encode())):
+        async with get_http_session().post(
+            client.messages_url,
+            data={"Body": message_body, "From": TWILIO_FROM_NUMBER, "To": phone},
+            auth=client.auth,
+            timeout=aiohttp.ClientTimeout(total=TWILIO_TIMEOUT_SECONDS),
+        ) as response:
+            payload = await response.json(content_type=None)
+
+            if response.status != 201:
+                error = f"Twilio rejected SMS: {payload.get('message', response.status)}"
+
+                # 4xx (bad number, opted out, ...): Twilio itself is fine
+                if 400 <= response.status < 500 and response.status != 429:
+                    raise ProviderRejectedError(error)
+                raise Exception(error)
+
+    return payload["sid"]
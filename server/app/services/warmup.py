@@ -0,0 +1,84 @@
+import asyncio
+import os
+
+import aiohttp
+
+from app.services.email_service import SENDGRID_API_BASE_URL
+from app.services.pipeline import warm_up_pipeline
+from app.services.sms_service import TWILIO_API_BASE_URL
+from app.utils.http import get_http_session
+from app.utils.providers import get_provider
+from app.utils.r2 import warm_up_r2
+from app.utils.r2_client import R2_CONFIGURED
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+
+# Startup waits at most this long; whatever is still cold warms on first use
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", 20))
+
+# Providers whose clients are built once in the gunicorn master
+_PROVIDERS = ("sendgrid", "twilio", "r2")
+
+
+def _configured(name: str) -> bool:
+    try:
+        get_provider(name)
+    except RuntimeError:
+        return False
+    return True
+
+
+def preload():
+    """
+    gunicorn master, after the app is imported (preload_app) and
+    before forking: build the provider clients once so their
+    read-only state (botocore's service models, ...) is shared
+    copy-on-write. Unconfigured providers are skipped.
+    """
+    for name in _PROVIDERS:
+        _configured(name)
+
+
+async def _prime_https(url: str):
+    # TLS context, DNS cache and one pooled keep-alive connection; the
+    # response itself doesn't matter
+    async with get_http_session().head(
+        url,
+        timeout=aiohttp.ClientTimeout(total=WARMUP_TIMEOUT_SECONDS),
+    ):
+        pass
+
+
+async def _step(name: str, coro):
+    try:
+        await coro
+    except Exception as e:
+        print("ERROR: warm-up failed:", name, str(e))
+
+
+async def warm_up():
+    """
+    Run a synthetic scan through the pipeline and prime the provider
+    connection pools, so the first scan on a fresh (or recycled)
+    worker doesn't pay for them. Never fails startup.
+    """
+    if not WARMUP_ENABLED:
+        return
+
+    steps = [_step("pipeline", warm_up_pipeline())]
+
+    if _configured("sendgrid"):
+        steps.append(_step("sendgrid", _prime_https(SENDGRID_API_BASE_URL)))
+    if _configured("twilio"):
+        steps.append(_step("twilio", _prime_https(TWILIO_API_BASE_URL)))
+    if R2_CONFIGURED:
+        # Client built off the loop (unless preload() already did)
+        steps.append(_step("r2", warm_up_r2()))
+
+    try:
+        await asyncio.wait_for(asyncio.gather(*steps), WARMUP_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        print("ERROR: warm-up timed out after", WARMUP_TIMEOUT_SECONDS, "seconds")
@@ -0,0 +1,258 @@
+import asyncio
+import base64
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from uuid import uuid4
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+# local  -> files on this host's disk, byte quota + TTL eviction
+# object -> R2 / S3 objects, AES-GCM encrypted before upload
+BLOB_STORE_BACKEND = os.getenv("BLOB_STORE_BACKEND", "local")
+
+BLOB_STORE_DIR = os.getenv(
+    "BLOB_STORE_DIR",
+    str(Path(tempfile.gettempdir()) / "live_scan_blobs"),
+)
+BLOB_STORE_QUOTA_BYTES = int(os.getenv("BLOB_STORE_QUOTA_BYTES", 512 * 1024 * 1024))
+# Other workers write to the same directory, so each one re-counts it
+# (with a TTL sweep) at least this often
+BLOB_STORE_RESCAN_SECONDS = int(os.getenv("BLOB_STORE_RESCAN_SECONDS", 60))
+
+BLOB_STORE_PREFIX = os.getenv("BLOB_STORE_PREFIX", "downloads/")
+# base64 (urlsafe) 32-byte key, required for the object backend
+BLOB_ENCRYPTION_KEY = os.getenv("BLOB_ENCRYPTION_KEY")
+
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class BlobStoreFullError(RuntimeError):
+    pass
+
+
+def _check_key(key: str):
+    if not _KEY_PATTERN.match(key):
+        raise ValueError("Invalid blob key")
+
+
+class LocalBlobStore:
+    """
+    One file per blob. The file's mtime is set to the blob's expiry,
+    so a sweep can evict leftovers (e.g. tokens lost in a restart)
+    without any other bookkeeping.
+    """
+
+    def __init__(self, root: str, quota_bytes: int):
+        self.root = Path(root)
+        self.quota_bytes = quota_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        # Running byte count of the directory, so a put doesn't have to
+        # scan it. Only this worker's puts/deletes are counted between
+        # sweeps; a sweep (at startup, then every BLOB_STORE_RESCAN_SECONDS)
+        # re-counts everything
+        self.lock = threading.Lock()
+        self.used = 0
+        self.counted_at = 0.0
+
+    def path(self, key: str) -> Path | None:
+        _check_key(key)
+        path = self.root / f"{key}.pdf"
+        return path if path.exists() else None
+
+    def _put(self, data: bytes, expires_at: float) -> str:
+        if time.time() - self.counted_at >= BLOB_STORE_RESCAN_SECONDS:
+            self._sweep()
+
+        if self.used + len(data) > self.quota_bytes:
+            self._sweep()
+            if self.used + len(data) > self.quota_bytes:
+                raise BlobStoreFullError("Download storage quota exceeded")
+
+        key = uuid4().hex
+        path = self.root / f"{key}.pdf"
+        tmp = path.with_suffix(".tmp")
+
+        tmp.write_bytes(data)
+        os.utime(tmp, (expires_at, expires_at))
+        tmp.replace(path)
+
+        with self.lock:
+            self.used += len(data)
+
+        return key
+
+    def _delete(self, key: str):
+        path = self.root / f"{key}.pdf"
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return
+
+        with self.lock:
+            self.used = max(0, self.used - size)
+
+    def _sweep(self) -> int:
+        """Evict expired blobs and re-count the bytes that are left."""
+        now = time.time()
+        removed = 0
+        used = 0
+
+        for entry in os.scandir(self.root):
+            try:
+                if not entry.is_file():
+                    continue
+
+                stat = entry.stat()
+                # .pdf mtime is the expiry; .tmp is a write in progress (or a crashed one)
+                expired = stat.st_mtime < now if entry.name.endswith(".pdf") else stat.st_mtime < now - 3600
+                if expired:
+                    os.unlink(entry.path)
+                    removed += 1
+                else:
+                    used += stat.st_size
+            except FileNotFoundError:
+                pass
+
+        with self.lock:
+            self.used = used
+            self.counted_at = now
+
+        return removed
+
+    async def put(self, data: bytes, expires_at: float) -> str:
+        return await asyncio.to_thread(self._put, data, expires_at)
+
+    async def get(self, key: str) -> bytes | None:
+        path = self.path(key)
+        if path is None:
+            return None
+
+        try:
+            return await asyncio.to_thread(path.read_bytes)
+        except FileNotFoundError:
+            return None
+
+    async def delete(self, key: str):
+        _check_key(key)
+        self._delete(key)
+
+    async def sweep(self) -> int:
+        return await asyncio.to_thread(self._sweep)
+
+
+class ObjectBlobStore:
+    """
+    Blobs as objects under BLOB_STORE_PREFIX, encrypted client-side
+    with AES-256-GCM (the object key is bound in as associated data).
+    Objects are deleted when their token expires; a bucket lifecycle
+    rule on the prefix catches anything a crash left behind.
+    """
+
+    def __init__(self, prefix: str, encryption_key: str | None):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        if not encryption_key:
+            raise RuntimeError("BLOB_ENCRYPTION_KEY not set")
+
+        key = base64.urlsafe_b64decode(encryption_key)
+        if len(key) != 32:
+            raise RuntimeError("BLOB_ENCRYPTION_KEY must be 32 bytes (base64)")
+
+        self.prefix = prefix
+        self.aead = AESGCM(key)
+
+    def path(self, key: str) -> Path | None:
+        return None
+
+    def _object_key(self, key: str) -> str:
+        _check_key(key)
+        return f"{self.prefix}{key}.pdf"
+
+    async def put(self, data: bytes, expires_at: float) -> str:
+        from app.utils.r2 import R2_BUCKET, r2_call
+
+        key = uuid4().hex
+        object_key = self._object_key(key)
+
+        nonce = os.urandom(12)
+        body = nonce + await asyncio.to_thread(self.aead.encrypt, nonce, data, object_key.encode())
+
+        await r2_call(
+            "put_object",
+            Bucket=R2_BUCKET,
+            Key=object_key,
+            Body=body,
+            ContentType="application/octet-stream",
+            Metadata={"expires-at": str(int(expires_at))},
+        )
+
+        return key
+
+    async def get(self, key: str) -> bytes | None:
+        from app.utils.r2 import R2_BUCKET, R2RejectedError, r2_call
+
+        object_key = self._object_key(key)
+
+        try:
+            obj = await r2_call("get_object", Bucket=R2_BUCKET, Key=object_key)
+        except R2RejectedError as e:
+            # Expired / already deleted; not an R2 failure
+            if e.code == "NoSuchKey":
+                return None
+            raise
+
+        body = await asyncio.to_thread(obj["Body"].read)
+        return await asyncio.to_thread(self.aead.decrypt, body[:12], body[12:], object_key.encode())
+
+    async def delete(self, key: str):
+        from app.utils.r2 import R2_BUCKET, r2_call
+
+        await r2_call("delete_object", Bucket=R2_BUCKET, Key=self._object_key(key))
+
+    async def sweep(self) -> int:
+        # Left to the bucket's lifecycle rule
+        return 0
+
+
+def _create_store():
+    if BLOB_STORE_BACKEND == "local":
+        return LocalBlobStore(BLOB_STORE_DIR, BLOB_STORE_QUOTA_BYTES)
+    if BLOB_STORE_BACKEND == "object":
+        return ObjectBlobStore(BLOB_STORE_PREFIX, BLOB_ENCRYPTION_KEY)
+    raise RuntimeError("BLOB_STORE_BACKEND must be local or object")
+
+
+blob_store = _create_store()
+
+
+async def put_blob(data: bytes, expires_at: float) -> str:
+    """Store a PDF until `expires_at`; returns its key."""
+    return await blob_store.put(data, expires_at)
+
+
+async def get_blob(key: str) -> bytes | None:
+    return await blob_store.get(key)
+
+
+def blob_path(key: str) -> Path | None:
+    """Local file for the blob (serve it directly), or None."""
+    return blob_store.path(key)
+
+
+async def delete_blob(key: str):
+    try:
+        await blob_store.delete(key)
+    except Exception as e:
+        print("ERROR: blob delete failed:", key, str(e))
+
+
+async def sweep_blobs() -> int:
+    """Evict expired blobs; returns how many were removed."""
+    return await blob_store.sweep()
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import time
+
+# -----------------------------
+# CONFIG (defaults; BREAKER_<NAME>_* overrides per provider)
+# -----------------------------
+# Consecutive failures that open the circuit
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+# How long an open circuit fails fast before letting a probe through
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", 30))
+# Probe calls allowed at once while half-open
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", 1))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the provider while its circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class ProviderRejectedError(Exception):
+    """
+    The provider answered but refused this request (4xx). Says nothing
+    about the provider's health, so it doesn't count towards opening.
+    """
+
+
+class CircuitBreaker:
+    """
+    Per-provider breaker: closed -> open after `failure_threshold`
+    consecutive failures (errors or blown latency budget), open ->
+    half-open after `reset_seconds`, half-open -> closed on a
+    successful probe or back to open on a failed one.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        budget_seconds: float,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = BREAKER_RESET_SECONDS,
+        half_open_probes: int = BREAKER_HALF_OPEN_PROBES,
+    ):
+        self.name = name
+        self.budget_seconds = budget_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+
+        self.calls = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _admit(self):
+        if self.state == OPEN:
+            retry_after = self.opened_at + self.reset_seconds - time.monotonic()
+            if retry_after > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, retry_after)
+            self.state = HALF_OPEN
+            self.probes = 0
+
+        if self.state == HALF_OPEN:
+            if self.probes >= self.half_open_probes:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.reset_seconds)
+            self.probes += 1
+
+    def _success(self):
+        if self.state == HALF_OPEN:
+            self.probes -= 1
+        self.state = CLOSED
+        self.failures = 0
+
+    def _failure(self):
+        if self.state == HALF_OPEN:
+            self.probes -= 1
+
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    async def call(self, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) within the latency budget, or fail fast."""
+        self._admit()
+        self.calls += 1
+
+        try:
+            result = await asyncio.wait_for(fn(*args, **kwargs), self.budget_seconds)
+
+        except ProviderRejectedError:
+            self._success()
+            raise
+
+        except asyncio.CancelledError:
+            # Caller gave up; no verdict on the provider
+            if self.state == HALF_OPEN:
+                self.probes -= 1
+            raise
+
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._failure()
+            raise
+
+        except Exception:
+            self._failure()
+            raise
+
+        self._success()
+        return result
+
+    def snapshot(self) -> dict:
+        retry_after = None
+        if self.state == OPEN:
+            retry_after = max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "budget_seconds": self.budget_seconds,
+            "retry_after_seconds": retry_after,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+# -----------------------------
+# REGISTRY
+# -----------------------------
+_BREAKERS: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str, budget_seconds: float) -> CircuitBreaker:
+    """
+    Shared breaker for a provider (one per process). Env overrides:
+    BREAKER_<NAME>_FAILURES, BREAKER_<NAME>_RESET_SECONDS,
+    BREAKER_<NAME>_BUDGET_SECONDS.
+    """
+    if name not in _BREAKERS:
+        prefix = f"BREAKER_{name.upper()}_"
+        _BREAKERS[name] = CircuitBreaker(
+            name,
+            budget_seconds=float(os.getenv(prefix + "BUDGET_SECONDS", budget_seconds)),
+            failure_threshold=int(os.getenv(prefix + "FAILURES", BREAKER_FAILURE_THRESHOLD)),
+            reset_seconds=float(os.getenv(prefix + "RESET_SECONDS", BREAKER_RESET_SECONDS)),
+        )
+
+    return _BREAKERS[name]
+
+
+def breaker_states() -> dict[str, dict]:
+    return {name: breaker.snapshot() for name, breaker in _BREAKERS.items()}
@@ -0,0 +1,41 @@
+import os
+
+import aiohttp
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+# One pooled session per worker process, shared by every outbound API client
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 32))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", 30))
+
+_session: aiohttp.ClientSession | None = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    Shared keep-alive session (created on first use, inside the loop).
+    Callers pass their own per-request timeout.
+    """
+    global _session
+
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=HTTP_POOL_SIZE,
+                keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+                ttl_dns_cache=300,
+            ),
+            raise_for_status=False,
+        )
+
+    return _session
+
+
+async def close_http_session():
+    global _session
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+
+    _session = None
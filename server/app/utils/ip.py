@@ -1,5 +1,57 @@
+import ipaddress
+import os
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+# X-Forwarded-For is only believed when the connection comes from one
+# of these proxies (comma-separated IPs / CIDRs, e.g. "10.0.0.0/8");
+# hops they appended are skipped from the right, and the first address
+# that isn't a trusted proxy is the client. Empty -> header ignored.
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(entry.strip(), strict=False)
+    for entry in os.getenv("TRUSTED_PROXIES", "").split(",")
+    if entry.strip()
+]
+
+# Alternative for proxies without stable addresses (PaaS load
+# balancers): the number of proxies in front of the app. The client is
+# then the N-th entry from the right. 0 -> use TRUSTED_PROXIES.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+
+
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
 def get_client_ip(request):
+    """
+    The client address for rate limits and consent records. Clients
+    can put anything in X-Forwarded-For, so only the hops added by our
+    own proxies are used, never the left-most entry.
+    """
+    peer = request.client.host if request.client else "unknown"
+
     xff = request.headers.get("x-forwarded-for")
-    if xff:
-        return xff.split(",")[0].strip()
-    return request.client.host if request.client else "unknown"
+    if not xff:
+        return peer
+
+    hops = [hop.strip() for hop in xff.split(",") if hop.strip()]
+
+    if TRUSTED_PROXY_HOPS:
+        # Fewer hops than proxies: the request skipped them, trust nothing
+        return hops[-TRUSTED_PROXY_HOPS] if len(hops) >= TRUSTED_PROXY_HOPS else peer
+
+    if not _is_trusted_proxy(peer):
+        return peer
+
+    for hop in reversed(hops):
+        if not _is_trusted_proxy(hop):
+            return hop
+
+    # Proxies all the way down (health checks from the proxy itself)
+    return hops[0] if hops else peer
@@ -0,0 +1,424 @@
+import asyncio
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+# sqlite -> every worker on the host adds into one file; /metrics on
+#           any worker shows the host totals (gunicorn)
+# memory -> this process only (single worker / local dev)
+METRICS_BACKEND = os.getenv("METRICS_BACKEND", "sqlite")
+METRICS_PATH = os.getenv(
+    "METRICS_PATH",
+    str(Path(tempfile.gettempdir()) / "live_scan_metrics.db"),
+)
+# How often a worker adds its local deltas to the shared file
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 10))
+
+# Share of scans / pipeline tasks run under tracemalloc for peak memory.
+# Tracing slows everything running in that process meanwhile, so keep
+# it low; in the web process overlapping scans count towards the peak.
+METRICS_TRACEMALLOC_SAMPLE_RATE = float(os.getenv("METRICS_TRACEMALLOC_SAMPLE_RATE", 0.01))
+
+STAGE_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+MEMORY_BYTES_BUCKETS = tuple(2 ** n * 1024 * 1024 for n in range(0, 11, 2))  # 1 MiB .. 1 GiB
+
+# name -> (type, help, histogram buckets)
+_FAMILIES = {
+    "livescan_stage_seconds": ("histogram", "Time spent in a scan stage or provider call.", STAGE_SECONDS_BUCKETS),
+    "livescan_stage_bytes_total": ("counter", "Bytes into / out of a stage.", None),
+    "livescan_stage_errors_total": ("counter", "Stage runs that raised.", None),
+    "livescan_stage_in_flight": ("gauge", "Stage runs in progress.", None),
+    "livescan_peak_memory_bytes": ("histogram", "Peak traced memory of a sampled scan or pipeline task.", MEMORY_BYTES_BUCKETS),
+}
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+# -----------------------------
+# LOCAL REGISTRY (this process)
+# -----------------------------
+class Registry:
+    """
+    Counters (histograms are stored as their _bucket/_sum/_count
+    counters) and gauges, keyed by (series name, rendered labels).
+    """
+
+    def __init__(self):
+        self.counters: dict[tuple[str, str], float] = {}
+        self.gauges: dict[tuple[str, str], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, labels: str, amount: float = 1.0):
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0.0) + amount
+
+    def add_gauge(self, name: str, labels: str, amount: float):
+        with self.lock:
+            self.gauges[(name, labels)] = self.gauges.get((name, labels), 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = _FAMILIES[name][2]
+        base = _labels(**labels)
+        sep = "," if base else ""
+
+        with self.lock:
+            for le in buckets:
+                if value <= le:
+                    key = (f"{name}_bucket", f'{base}{sep}le="{_format(float(le))}"')
+                    self.counters[key] = self.counters.get(key, 0.0) + 1
+            for key, amount in (
+                ((f"{name}_bucket", f'{base}{sep}le="+Inf"'), 1),
+                ((f"{name}_sum", base), value),
+                ((f"{name}_count", base), 1),
+            ):
+                self.counters[key] = self.counters.get(key, 0.0) + amount
+
+    def take_counters(self) -> dict:
+        """Counter deltas since the last call (sqlite backend)."""
+        with self.lock:
+            counters, self.counters = self.counters, {}
+        return counters
+
+    def snapshot(self) -> tuple[dict, dict]:
+        with self.lock:
+            return dict(self.counters), dict(self.gauges)
+
+
+_registry = Registry()
+
+
+# -----------------------------
+# SHARED STORE (SQLite, every worker on the host)
+# -----------------------------
+class SqliteMetrics:
+    """
+    Counters are summed into one row per series; gauges are kept per
+    process and only live processes are added up.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+
+        # gunicorn --preload creates this in the master; forked workers
+        # must open their own connections, not share the master's
+        os.register_at_fork(after_in_child=self._forget_connections)
+
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS metric_counters (
+                    series TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    PRIMARY KEY (series, labels)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS metric_gauges (
+                    pid INTEGER NOT NULL,
+                    series TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    PRIMARY KEY (pid, series, labels)
+                )
+            """)
+
+    def _forget_connections(self):
+        self.local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def flush(self, registry: Registry):
+        counters = registry.take_counters()
+        _, gauges = registry.snapshot()
+        conn = self._conn()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                """
+                INSERT INTO metric_counters (series, labels, value) VALUES (?, ?, ?)
+                ON CONFLICT (series, labels) DO UPDATE SET value = value + excluded.value
+                """,
+                [(series, labels, value) for (series, labels), value in counters.items()],
+            )
+            conn.executemany(
+                """
+                INSERT INTO metric_gauges (pid, series, labels, value) VALUES (?, ?, ?, ?)
+                ON CONFLICT (pid, series, labels) DO UPDATE SET value = excluded.value
+                """,
+                [(os.getpid(), series, labels, value) for (series, labels), value in gauges.items()],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            # Keep the deltas for the next flush
+            for (series, labels), value in counters.items():
+                registry.inc(series, labels, value)
+            raise
+
+    def read(self) -> tuple[dict, dict]:
+        conn = self._conn()
+        counters = {
+            (series, labels): value
+            for series, labels, value in conn.execute("SELECT series, labels, value FROM metric_counters")
+        }
+
+        gauges = {}
+        dead = set()
+        for pid, series, labels, value in conn.execute("SELECT pid, series, labels, value FROM metric_gauges"):
+            if pid in dead or not _alive(pid):
+                dead.add(pid)
+                continue
+            gauges[(series, labels)] = gauges.get((series, labels), 0.0) + value
+
+        if dead:
+            conn.executemany("DELETE FROM metric_gauges WHERE pid = ?", [(pid,) for pid in dead])
+
+        return counters, gauges
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _create_store():
+    if METRICS_BACKEND == "memory":
+        return None
+    if METRICS_BACKEND == "sqlite":
+        return SqliteMetrics(METRICS_PATH)
+    raise RuntimeError("METRICS_BACKEND must be memory or sqlite")
+
+
+_store = _create_store()
+
+
+# -----------------------------
+# STAGES
+# -----------------------------
+# Inside a pipeline pool process: stage samples are collected here and
+# shipped back with the task's result (see collect_stages)
+_collected: list | None = None
+
+
+class StageHandle:
+    """Yielded by stage(); set the byte counts once they are known."""
+    __slots__ = ("bytes_in", "bytes_out")
+
+    def __init__(self, bytes_in: int, bytes_out: int):
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+
+
+def record_stage(name: str, seconds: float, bytes_in: int = 0, bytes_out: int = 0, error: bool = False):
+    if _collected is not None:
+        _collected.append((name, seconds, bytes_in, bytes_out, error))
+        return
+
+    _registry.observe("livescan_stage_seconds", seconds, stage=name)
+    if bytes_in:
+        _registry.inc("livescan_stage_bytes_total", _labels(stage=name, direction="in"), bytes_in)
+    if bytes_out:
+        _registry.inc("livescan_stage_bytes_total", _labels(stage=name, direction="out"), bytes_out)
+    if error:
+        _registry.inc("livescan_stage_errors_total", _labels(stage=name))
+
+
+@contextmanager
+def stage(name: str, bytes_in: int = 0, bytes_out: int = 0):
+    """
+    Time a block as stage `name` (histogram + in-flight gauge + errors
+    + bytes). Works in sync code, async code and pool processes.
+
+        with stage("sendgrid", bytes_out=len(body)):
+            ...
+    """
+    handle = StageHandle(bytes_in, bytes_out)
+    in_flight = _collected is None
+
+    if in_flight:
+        _registry.add_gauge("livescan_stage_in_flight", _labels(stage=name), 1)
+
+    start = time.perf_counter()
+    error = False
+
+    try:
+        yield handle
+    except Exception:
+        error = True
+        raise
+    finally:
+        if in_flight:
+            _registry.add_gauge("livescan_stage_in_flight", _labels(stage=name), -1)
+        record_stage(name, time.perf_counter() - start, handle.bytes_in, handle.bytes_out, error)
+
+
+def _sampled() -> bool:
+    return random.random() < METRICS_TRACEMALLOC_SAMPLE_RATE and not tracemalloc.is_tracing()
+
+
+@contextmanager
+def traced_peak(name: str):
+    """Record the peak traced memory of a sampled share of these blocks."""
+    if not _sampled():
+        yield
+        return
+
+    tracemalloc.start()
+    try:
+        yield
+        _registry.observe("livescan_peak_memory_bytes", tracemalloc.get_traced_memory()[1], stage=name)
+    finally:
+        tracemalloc.stop()
+
+
+def collect_stages(fn, *args):
+    """
+    Pool process side of run_in_pipeline: run fn, collecting its stage
+    samples (and, if sampled, its peak memory) to hand back.
+    """
+    global _collected
+
+    _collected = []
+    traced = _sampled()
+    peak = None
+
+    if traced:
+        tracemalloc.start()
+    try:
+        result = fn(*args)
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        if traced:
+            tracemalloc.stop()
+        samples, _collected = _collected, None
+
+    return result, samples, peak
+
+
+def record_collected(name: str, samples: list, peak: int | None):
+    """Loop side: record what collect_stages brought back from `name`."""
+    for sample in samples:
+        record_stage(*sample)
+
+    if peak is not None:
+        _registry.observe("livescan_peak_memory_bytes", peak, stage=name)
+
+
+# -----------------------------
+# EXPOSITION
+# -----------------------------
+def flush_metrics():
+    if _store is not None:
+        _store.flush(_registry)
+
+
+def _read() -> tuple[dict, dict]:
+    if _store is None:
+        return _registry.snapshot()
+
+    flush_metrics()
+    return _store.read()
+
+
+def _family(series: str) -> str:
+    for suffix in ("_bucket", "_sum", "_count"):
+        if series.endswith(suffix) and series.removesuffix(suffix) in _FAMILIES:
+            return series.removesuffix(suffix)
+    return series
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _bucket_order(labels: str) -> float:
+    _, found, le = labels.rpartition('le="')
+    if not found:
+        return 0.0
+    le = le.rstrip('"')
+    return math.inf if le == "+Inf" else float(le)
+
+
+def render_metrics() -> str:
+    """Prometheus text format (0.0.4)."""
+    counters, gauges = _read()
+
+    series = {}
+    for (name, labels), value in (*counters.items(), *gauges.items()):
+        series.setdefault(_family(name), []).append((name, labels, value))
+
+    lines = []
+    for family, (kind, help_text, _) in _FAMILIES.items():
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+
+        rows = sorted(
+            series.get(family, []),
+            key=lambda row: (row[1].split(',le="')[0], row[0] != f"{family}_bucket", _bucket_order(row[1]), row[0]),
+        )
+        for name, labels, value in rows:
+            lines.append(f"{name}{{{labels}}} {_format(value)}" if labels else f"{name} {_format(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------------
+# BACKGROUND FLUSH
+# -----------------------------
+_flusher: asyncio.Task | None = None
+
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            await asyncio.to_thread(flush_metrics)
+        except Exception as e:
+            print("ERROR: metrics flush failed:", str(e))
+
+
+def start_metrics_flusher():
+    global _flusher
+
+    if _store is None or _flusher is not None:
+        return
+
+    _flusher = asyncio.create_task(_flush_loop())
+
+
+async def stop_metrics_flusher():
+    global _flusher
+
+    if _flusher is None:
+        return
+
+    _flusher.cancel()
+    _flusher = None
+    await asyncio.to_thread(flush_metrics)
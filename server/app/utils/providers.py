@@ -0,0 +1,85 @@
+import importlib
+import importlib.util
+import sys
+import threading
+import types
+from typing import Callable
+
+# -----------------------------
+# PROVIDER REGISTRY
+# -----------------------------
+# Provider clients (R2, SendGrid, Twilio) are built on first use, not
+# at import: the app boots without their secrets or SDKs, and a missing
+# setting only fails the calls that need it.
+_FACTORIES: dict[str, Callable] = {}
+_INSTANCES: dict = {}
+_lock = threading.Lock()
+
+
+def register_provider(name: str, factory: Callable):
+    """Register a zero-argument factory; it runs once, on first get_provider()."""
+    _FACTORIES[name] = factory
+
+
+def get_provider(name: str):
+    """
+    The shared client for `name`, created on first use. A factory
+    that raises (e.g. RuntimeError for a missing env var) is retried
+    on the next call.
+    """
+    try:
+        return _INSTANCES[name]
+    except KeyError:
+        pass
+
+    with _lock:
+        if name not in _INSTANCES:
+            _INSTANCES[name] = _FACTORIES[name]()
+        return _INSTANCES[name]
+
+
+def loaded_providers() -> list[str]:
+    return sorted(_INSTANCES)
+
+
+# -----------------------------
+# HEAVY LIBRARIES
+# -----------------------------
+def lazy_import(name: str):
+    """
+    Import a module on first attribute access instead of now (cv2,
+    numpy, reportlab, ... are only needed once a scan is rendered).
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    # find_spec() on a submodule imports its parent packages right away
+    if "." in name:
+        return _LazySubmodule(name)
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        # Missing library: fail where it is used, like a normal import would
+        return importlib.import_module(name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+class _LazySubmodule(types.ModuleType):
+    """
+    Stand-in for a submodule (PIL.Image, reportlab.pdfgen.canvas, ...):
+    nothing, not even its packages, is imported before the first
+    attribute access.
+    """
+
+    def __getattr__(self, attr: str):
+        module = importlib.import_module(self.__name__)
+        # Later lookups hit the copied namespace, not __getattr__
+        self.__dict__.update(vars(module))
+        return getattr(module, attr)
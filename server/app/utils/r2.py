@@ -1,10 +1,111 @@
+import asyncio
 import json
-from app.utils.r2_client import r2_client, R2_BUCKET
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from app.utils.circuit_breaker import ProviderRejectedError, get_breaker
+from app.utils.metrics import stage
+from app.utils.r2_client import (
+    get_r2_client,
+    R2_BUCKET,
+    R2_MAX_CONCURRENCY,
+    R2_CONNECT_TIMEOUT,
+    R2_READ_TIMEOUT,
+    R2_MAX_ATTEMPTS,
+)
+
+# Upper bound for one call including all retries; the loop stops waiting after this
+R2_CALL_TIMEOUT = float(os.getenv(
+    "R2_CALL_TIMEOUT",
+    R2_MAX_ATTEMPTS * (R2_CONNECT_TIMEOUT + R2_READ_TIMEOUT),
+))
+
+# boto3 is blocking; its calls get their own bounded pool so they never
+# run on the event loop or starve the default executor
+_executor = ThreadPoolExecutor(max_workers=R2_MAX_CONCURRENCY, thread_name_prefix="r2")
+
+# The call timeout doubles as the breaker's latency budget
+_BREAKER = get_breaker("r2", R2_CALL_TIMEOUT)
+
+
+class R2RejectedError(ProviderRejectedError):
+    """R2 refused this request (4xx: NoSuchKey, AccessDenied, ...); `code` is the S3 error code."""
+
+    def __init__(self, method: str, code: str, status: int):
+        super().__init__(f"R2 {method} rejected: {code} ({status})")
+        self.code = code
+        self.status = status
+
+
+async def r2_call(method: str, **kwargs):
+    """
+    Run a boto3 S3 client method off the event loop, within the R2
+    latency budget (fails fast while the R2 circuit is open). 4xx
+    errors are raised as R2RejectedError and leave the breaker alone.
+    """
+    loop = asyncio.get_running_loop()
+    call = partial(_timed_call, method, getattr(get_r2_client(), method), kwargs)
+
+    return await _BREAKER.call(loop.run_in_executor, _executor, call)
+
+
+def _timed_call(method: str, fn, kwargs: dict):
+    # Timed in the pool thread: covers boto3's retries, not the queueing
+    body = kwargs.get("Body")
+
+    with stage(f"r2_{method}", bytes_out=len(body) if isinstance(body, bytes) else 0) as timed:
+        try:
+            response = fn(**kwargs)
+        except Exception as e:
+            rejected = _rejected(method, e)
+            if rejected is None:
+                raise
+            raise rejected from e
+
+        timed.bytes_in = response.get("ContentLength", 0) if method == "get_object" else 0
+
+    return response
+
+
+def _rejected(method: str, error: Exception) -> R2RejectedError | None:
+    """
+    4xx (except 429) from R2: this request is bad (missing key, denied),
+    R2 itself is fine, so it mustn't count towards opening the breaker.
+    """
+    # Already loaded by the client that raised it
+    from botocore.exceptions import ClientError
+
+    if not isinstance(error, ClientError):
+        return None
+
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+    if not 400 <= status < 500 or status == 429:
+        return None
+
+    return R2RejectedError(method, error.response.get("Error", {}).get("Code", ""), status)
+
 
 async def upload_json_to_r2(key: str, data: dict):
-    r2_client.put_object(
+    await r2_call(
+        "put_object",
         Bucket=R2_BUCKET,
         Key=key,
-        Body=json.dumps(data, indent=2),
+        Body=json.dumps(data, indent=2).encode(),
         ContentType="application/json"
     )
+
+
+async def warm_up_r2():
+    """
+    Build the client and open a pooled connection to the bucket,
+    both off the loop. Not behind the breaker: a failed warm-up
+    says nothing about the first real call.
+    """
+    loop = asyncio.get_running_loop()
+    client = await loop.run_in_executor(_executor, get_r2_client)
+    await loop.run_in_executor(_executor, partial(client.head_bucket, Bucket=R2_BUCKET))
+
+
+def shutdown_r2():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -1,27 +1,65 @@
 import os
-import boto3
+
+from app.utils.providers import get_provider, register_provider
 
 # -----------------------------
-# ENV VARIABLES (REQUIRED)
+# ENV VARIABLES (REQUIRED ON FIRST USE)
 # -----------------------------
 ACCOUNT_ID = os.getenv("R2_ACCOUNT_ID")
 R2_ACCESS_KEY = os.getenv("R2_ACCESS_KEY_ID")
 R2_SECRET_KEY = os.getenv("R2_SECRET_ACCESS_KEY")
 R2_BUCKET = os.getenv("R2_BUCKET_NAME")
-R2_ENDPOINT = f"https://{ACCOUNT_ID}.r2.cloudflarestorage.com"
 
-if not all([R2_ENDPOINT, R2_ACCESS_KEY, R2_SECRET_KEY, R2_BUCKET]):
-    raise RuntimeError("Missing one or more R2 environment variables")
+# Override to point at a local S3-compatible server (MinIO, moto, ...)
+R2_ENDPOINT = os.getenv("R2_ENDPOINT_URL") or (
+    f"https://{ACCOUNT_ID}.r2.cloudflarestorage.com" if ACCOUNT_ID else None
+)
+
+R2_CONFIGURED = all([R2_ENDPOINT, R2_ACCESS_KEY, R2_SECRET_KEY, R2_BUCKET])
+
+# -----------------------------
+# CONNECTION / RETRY TUNING
+# -----------------------------
+# Threads that may run R2 calls at once; the HTTP pool is sized to match
+R2_MAX_CONCURRENCY = int(os.getenv("R2_MAX_CONCURRENCY", 16))
+R2_CONNECT_TIMEOUT = float(os.getenv("R2_CONNECT_TIMEOUT", 2))
+R2_READ_TIMEOUT = float(os.getenv("R2_READ_TIMEOUT", 5))
+# Total attempts incl. the first; "standard" mode backs off exponentially with jitter
+R2_MAX_ATTEMPTS = int(os.getenv("R2_MAX_ATTEMPTS", 3))
 
 # -----------------------------
 # R2 CLIENT (S3 COMPATIBLE)
 # -----------------------------
-r2_client = boto3.client(
-    "s3",
-    endpoint_url=R2_ENDPOINT,
-    aws_access_key_id=R2_ACCESS_KEY,
-    aws_secret_access_key=R2_SECRET_KEY,
-    region_name="auto",  # REQUIRED for Cloudflare R2
-)
+def _create_r2_client():
+    # boto3 takes a few hundred ms to import and build a client
+    import boto3
+    from botocore.config import Config
+
+    if not R2_CONFIGURED:
+        raise RuntimeError("Missing one or more R2 environment variables")
+
+    return boto3.client(
+        "s3",
+        endpoint_url=R2_ENDPOINT,
+        aws_access_key_id=R2_ACCESS_KEY,
+        aws_secret_access_key=R2_SECRET_KEY,
+        region_name="auto",  # REQUIRED for Cloudflare R2
+        config=Config(
+            max_pool_connections=R2_MAX_CONCURRENCY,
+            connect_timeout=R2_CONNECT_TIMEOUT,
+            read_timeout=R2_READ_TIMEOUT,
+            retries={"max_attempts": R2_MAX_ATTEMPTS, "mode": "standard"},
+            tcp_keepalive=True,
+        ),
+    )
+
+
+register_provider("r2", _create_r2_client)
+
+
+def get_r2_client():
+    """The shared boto3 S3 client, created on first use."""
+    return get_provider("r2")
+
 
-__all__ = ["r2_client", "R2_BUCKET"]
+__all__ = ["get_r2_client", "R2_BUCKET", "R2_CONFIGURED", "R2_MAX_CONCURRENCY", "R2_CONNECT_TIMEOUT", "R2_READ_TIMEOUT", "R2_MAX_ATTEMPTS"]
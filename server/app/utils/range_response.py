@@ -0,0 +1,156 @@
+import hashlib
+import mmap
+import os
+import re
+from pathlib import Path
+
+import anyio
+import anyio.lowlevel
+from fastapi import HTTPException
+from starlette.responses import Response
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+DOWNLOAD_CHUNK_BYTES = int(os.getenv("DOWNLOAD_CHUNK_BYTES", 256 * 1024))
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def blob_etag(blob_key: str) -> str:
+    """Strong ETag for an (immutable) blob, without exposing its key."""
+    return '"' + hashlib.sha256(blob_key.encode()).hexdigest()[:32] + '"'
+
+
+def parse_range(range_header: str | None, if_range: str | None, etag: str, size: int):
+    """
+    (start, end) inclusive for a single satisfiable byte range, or
+    None to send the whole body. Multiple ranges, bad syntax and a
+    stale If-Range all fall back to the whole body (RFC 9110).
+    """
+    if not range_header or (if_range is not None and if_range != etag):
+        return None
+
+    match = _RANGE_PATTERN.match(range_header.replace(" ", ""))
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+
+    first, last = match.groups()
+
+    if first == "":
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+
+    return start, end
+
+
+class BlobResponse(Response):
+    """
+    A PDF from disk (`path`) or memory (`data`), whole or one byte
+    range. Files go out via the server's zero-copy extension when it
+    has one, else as slices of an mmap. Streaming stops as soon as
+    the client disconnects.
+    """
+
+    def __init__(
+        self,
+        *,
+        size: int,
+        etag: str,
+        filename: str,
+        byte_range: tuple[int, int] | None,
+        path: Path | None = None,
+        data: bytes | None = None,
+        media_type: str = "application/pdf",
+    ):
+        self.path = path
+        self.data = data
+        self.size = size
+        self.start, self.end = byte_range or (0, size - 1)
+
+        headers = {
+            "Accept-Ranges": "bytes",
+            "ETag": etag,
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "private, no-store",
+        }
+        if byte_range is not None:
+            headers["Content-Range"] = f"bytes {self.start}-{self.end}/{size}"
+
+        super().__init__(
+            status_code=206 if byte_range is not None else 200,
+            headers=headers,
+            media_type=media_type,
+        )
+        self.headers["content-length"] = str(self.end - self.start + 1)
+
+    async def _send_file(self, scope, send):
+        length = self.end - self.start + 1
+
+        with open(self.path, "rb") as file:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.start,
+                    "count": length,
+                    "more_body": False,
+                })
+                return
+
+            # Blobs are small and were just written, so the pages are in
+            # the cache; slicing the map costs no read() per chunk
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for offset in range(self.start, self.end + 1, DOWNLOAD_CHUNK_BYTES):
+                    chunk_end = min(offset + DOWNLOAD_CHUNK_BYTES, self.end + 1)
+                    await send({
+                        "type": "http.response.body",
+                        "body": mapped[offset:chunk_end],
+                        "more_body": chunk_end <= self.end,
+                    })
+                    # Yield, so a disconnect is noticed between chunks
+                    await anyio.lowlevel.checkpoint()
+
+    async def _send_data(self, send):
+        view = memoryview(self.data)
+        for offset in range(self.start, self.end + 1, DOWNLOAD_CHUNK_BYTES):
+            chunk_end = min(offset + DOWNLOAD_CHUNK_BYTES, self.end + 1)
+            await send({
+                "type": "http.response.body",
+                "body": bytes(view[offset:chunk_end]),
+                "more_body": chunk_end <= self.end,
+            })
+            await anyio.lowlevel.checkpoint()
+
+    async def __call__(self, scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+        async with anyio.create_task_group() as tg:
+
+            async def watch_disconnect():
+                while (await receive())["type"] != "http.disconnect":
+                    pass
+                tg.cancel_scope.cancel()
+
+            tg.start_soon(watch_disconnect)
+
+            if self.path is not None:
+                await self._send_file(scope, send)
+            else:
+                await self._send_data(send)
+
+            tg.cancel_scope.cancel()
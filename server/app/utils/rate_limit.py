@@ -0,0 +1,252 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import NamedTuple
+
+from fastapi import HTTPException, Request
+
+from app.utils.ip import get_client_ip
+from app.utils.session import verify_session
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+# sqlite -> buckets shared by every worker process on the host
+# memory -> per-process buckets (single worker / local dev)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite")
+RATE_LIMIT_PATH = os.getenv(
+    "RATE_LIMIT_PATH",
+    str(Path(tempfile.gettempdir()) / "live_scan_rate_limit.db"),
+)
+
+# Per signed session (one customer) and per client IP (a whole store
+# behind one NAT shares it, so it is looser). Requests without a valid
+# session only get the anonymous per-IP limit.
+SCAN_SESSION_RATE_LIMIT = os.getenv("SCAN_SESSION_RATE_LIMIT", "3/minute")
+SCAN_IP_RATE_LIMIT = os.getenv("SCAN_IP_RATE_LIMIT", "30/minute")
+SCAN_ANONYMOUS_RATE_LIMIT = os.getenv("SCAN_ANONYMOUS_RATE_LIMIT", "3/minute")
+INIT_IP_RATE_LIMIT = os.getenv("INIT_IP_RATE_LIMIT", "30/minute")
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class Limit(NamedTuple):
+    """Token bucket: `capacity` tokens, refilled evenly over `period` seconds."""
+    capacity: int
+    period: float
+
+    @classmethod
+    def parse(cls, spec: str) -> "Limit":
+        # "3/minute", "30/hour", ...
+        count, _, unit = spec.partition("/")
+        if unit not in _PERIODS:
+            raise RuntimeError(f"Invalid rate limit: {spec}")
+        return cls(int(count), _PERIODS[unit])
+
+
+def _refill(tokens: float, updated_at: float, limit: Limit, now: float) -> float:
+    rate = limit.capacity / limit.period
+    return min(limit.capacity, tokens + (now - updated_at) * rate)
+
+
+def _retry_after(tokens: float, limit: Limit) -> float:
+    return (1 - tokens) * limit.period / limit.capacity
+
+
+# -----------------------------
+# BACKENDS
+# -----------------------------
+class MemoryBuckets:
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, checks: list[tuple[str, Limit]]) -> float:
+        """Take one token from every bucket, or none; returns retry-after (0 = allowed)."""
+        now = time.time()
+
+        with self.lock:
+            levels = []
+            for key, limit in checks:
+                tokens, updated_at = self.buckets.get(key, (limit.capacity, now))
+                levels.append(_refill(tokens, updated_at, limit, now))
+
+            wait = max(
+                (_retry_after(tokens, limit) for tokens, (_, limit) in zip(levels, checks) if tokens < 1),
+                default=0.0,
+            )
+            if wait:
+                return wait
+
+            for tokens, (key, _) in zip(levels, checks):
+                self.buckets[key] = (tokens - 1, now)
+
+            return 0.0
+
+    def purge(self, idle_seconds: float):
+        cutoff = time.time() - idle_seconds
+        with self.lock:
+            for key in [k for k, (_, updated_at) in self.buckets.items() if updated_at < cutoff]:
+                del self.buckets[key]
+
+
+class SqliteBuckets:
+    """
+    Buckets in a WAL-mode SQLite file. Every check runs in one
+    BEGIN IMMEDIATE transaction, so all workers on the host see one
+    consistent token count.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+
+        # gunicorn --preload creates this in the master; forked workers
+        # must open their own connections, not share the master's
+        os.register_at_fork(after_in_child=self._forget_connections)
+
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS rate_buckets_updated_at
+                ON rate_buckets (updated_at)
+            """)
+
+    def _forget_connections(self):
+        self.local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def take(self, checks: list[tuple[str, Limit]]) -> float:
+        conn = self._conn()
+        now = time.time()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = []
+            for key, limit in checks:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens, updated_at = row if row else (limit.capacity, now)
+                levels.append(_refill(tokens, updated_at, limit, now))
+
+            wait = max(
+                (_retry_after(tokens, limit) for tokens, (_, limit) in zip(levels, checks) if tokens < 1),
+                default=0.0,
+            )
+
+            if not wait:
+                conn.executemany(
+                    """
+                    INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+                    """,
+                    [(key, tokens - 1, now) for tokens, (key, _) in zip(levels, checks)],
+                )
+
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return wait
+
+    def purge(self, idle_seconds: float):
+        self._conn().execute(
+            "DELETE FROM rate_buckets WHERE updated_at < ?",
+            (time.time() - idle_seconds,),
+        )
+
+
+def _create_buckets():
+    if RATE_LIMIT_BACKEND == "memory":
+        return MemoryBuckets()
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SqliteBuckets(RATE_LIMIT_PATH)
+    raise RuntimeError("RATE_LIMIT_BACKEND must be memory or sqlite")
+
+
+buckets = _create_buckets()
+
+_SCAN_SESSION = Limit.parse(SCAN_SESSION_RATE_LIMIT)
+_SCAN_IP = Limit.parse(SCAN_IP_RATE_LIMIT)
+_SCAN_ANONYMOUS = Limit.parse(SCAN_ANONYMOUS_RATE_LIMIT)
+_INIT_IP = Limit.parse(INIT_IP_RATE_LIMIT)
+
+# A bucket idle for its longest period is full again; its row can go
+_IDLE_SECONDS = max(limit.period for limit in (_SCAN_SESSION, _SCAN_IP, _SCAN_ANONYMOUS, _INIT_IP))
+_PURGE_EVERY = 500
+_calls = 0
+
+
+# -----------------------------
+# PUBLIC API
+# -----------------------------
+async def enforce(checks: list[tuple[str, Limit]]):
+    """Consume one token from every bucket or raise 429 with Retry-After."""
+    global _calls
+
+    wait = await asyncio.to_thread(buckets.take, checks)
+
+    _calls += 1
+    if _calls % _PURGE_EVERY == 0:
+        await asyncio.to_thread(buckets.purge, _IDLE_SECONDS)
+
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests. Please try again shortly.",
+            headers={"Retry-After": str(int(wait) + 1)},
+        )
+
+
+def _valid_session(session_id: str | None, session_token: str | None) -> bool:
+    if not session_id or not session_token:
+        return False
+
+    try:
+        uuid.UUID(session_id)
+    except ValueError:
+        return False
+
+    return verify_session(session_id, session_token)
+
+
+async def limit_scan(request: Request, session_id: str | None, session_token: str | None):
+    """
+    Scan uploads: per signed session plus a looser per-IP bucket, or
+    the strict anonymous per-IP bucket when no valid session is sent.
+    """
+    ip = get_client_ip(request)
+
+    if _valid_session(session_id, session_token):
+        await enforce([
+            (f"scan:session:{session_id}", _SCAN_SESSION),
+            (f"scan:ip:{ip}", _SCAN_IP),
+        ])
+    else:
+        await enforce([(f"scan:anon:{ip}", _SCAN_ANONYMOUS)])
+
+
+async def limit_init(request: Request):
+    """Session minting, so new sessions can't be used to dodge limit_scan."""
+    await enforce([(f"init:ip:{get_client_ip(request)}", _INIT_IP)])
@@ -1,59 +1,376 @@
-from datetime import datetime, timedelta
-from uuid import uuid4
+import heapq
+import os
 import random
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from uuid import uuid4
+
+from app.utils.blob_store import delete_blob
 
-# In-memory token store
-DOWNLOAD_TOKENS = {}
+# -----------------------------
+# CONFIG
+# -----------------------------
+# memory -> per-process dict (single worker only)
+# sqlite -> shared WAL database, safe across gunicorn workers on one host
+# (the default when gunicorn runs several workers)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+TOKEN_STORE_BACKEND = os.getenv("TOKEN_STORE_BACKEND", "sqlite" if WEB_CONCURRENCY > 1 else "memory")
+TOKEN_STORE_PATH = os.getenv(
+    "TOKEN_STORE_PATH",
+    str(Path(tempfile.gettempdir()) / "live_scan_tokens.db"),
+)
+
+# Other workers can add earlier deadlines to a shared store; re-check at least this often
+TOKEN_SWEEP_MAX_SECONDS = int(os.getenv("TOKEN_SWEEP_MAX_SECONDS", 300))
 
 DEFAULT_EXPIRY_MINUTES = 60
+DEFAULT_MAX_ATTEMPTS = 3
+
+# After the first correct PIN, the same PIN may resume an interrupted
+# download (HTTP Range) for this long, until the whole file is delivered
+DOWNLOAD_GRACE_SECONDS = int(os.getenv("DOWNLOAD_GRACE_SECONDS", 600))
+
+# redeem_token() outcomes
+REDEEMED = "redeemed"
+NOT_FOUND = "not_found"
+EXPIRED = "expired"
+ALREADY_USED = "used"
+LOCKED = "locked"
+INVALID_PIN = "invalid_pin"
+LOCKED_NOW = "locked_now"
+
+
+class MemoryTokenStore:
+    """
+    Tokens in a dict; every read-modify-write happens under one lock.
+    A min-heap on expires_at makes cleanup O(expired) instead of a scan.
+    """
+
+    def __init__(self):
+        self.tokens = {}
+        self.expiry_heap = []
+        self.lock = threading.Lock()
+
+    def create(self, record: dict):
+        with self.lock:
+            self.tokens[record["token"]] = record
+            heapq.heappush(self.expiry_heap, (record["expires_at"], record["token"]))
+
+    def get(self, token: str):
+        with self.lock:
+            record = self.tokens.get(token)
+
+            if not record:
+                return None
+
+            # ⏱ Expired (removed, with its blob, by cleanup_expired)
+            if time.time() > record["expires_at"]:
+                return None
+
+            return dict(record)
+
+    def redeem(self, token: str, pin: str):
+        with self.lock:
+            record = self.tokens.get(token)
+
+            if not record:
+                return NOT_FOUND, None
+            if time.time() > record["expires_at"]:
+                return EXPIRED, dict(record)
+            if record["used"]:
+                return ALREADY_USED, dict(record)
+            if record["locked"]:
+                return LOCKED, dict(record)
+
+            if pin != record["pin"]:
+                record["attempts"] += 1
+                if record["attempts"] >= record["max_attempts"]:
+                    record["locked"] = True
+                    return LOCKED_NOW, dict(record)
+                return INVALID_PIN, dict(record)
+
+            now = time.time()
+            if record["redeemed_at"] is not None and now - record["redeemed_at"] > DOWNLOAD_GRACE_SECONDS:
+                return ALREADY_USED, dict(record)
+
+            if record["redeemed_at"] is None:
+                record["redeemed_at"] = now
+            return REDEEMED, dict(record)
+
+    def complete(self, token: str, pin: str) -> str | None:
+        with self.lock:
+            record = self.tokens.get(token)
+            if not record or record["used"] or record["redeemed_at"] is None or pin != record["pin"]:
+                return None
+
+            record["used"] = True
+            return record["blob_key"]
+
+    def invalidate(self, token: str):
+        with self.lock:
+            if token in self.tokens:
+                self.tokens[token]["used"] = True
+
+    def cleanup_expired(self) -> list[str]:
+        """Drop expired tokens; returns their blob keys."""
+        now = time.time()
+        expired_blobs = []
+
+        with self.lock:
+            while self.expiry_heap and self.expiry_heap[0][0] < now:
+                expires_at, token = heapq.heappop(self.expiry_heap)
+                record = self.tokens.get(token)
+
+                if record and record["expires_at"] == expires_at:
+                    del self.tokens[token]
+                    expired_blobs.append(record["blob_key"])
+
+        return expired_blobs
+
+    def next_expiry(self) -> float | None:
+        with self.lock:
+            while self.expiry_heap and self.expiry_heap[0][1] not in self.tokens:
+                heapq.heappop(self.expiry_heap)
+
+            return self.expiry_heap[0][0] if self.expiry_heap else None
+
+
+class SqliteTokenStore:
+    """
+    Tokens in a SQLite database in WAL mode, shared by every worker
+    process on the host. State transitions are single conditional
+    UPDATEs (compare-and-set), so concurrent PIN attempts can't
+    double-count or redeem a token twice.
+    """
+
+    COLUMNS = ("token", "blob_key", "pin", "expires_at", "used", "attempts", "max_attempts", "locked", "redeemed_at")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+
+        # gunicorn --preload creates this in the master; forked workers
+        # must open their own connections, not share the master's
+        os.register_at_fork(after_in_child=self._forget_connections)
+
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS download_tokens (
+                    token TEXT PRIMARY KEY,
+                    blob_key TEXT NOT NULL,
+                    pin TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    used INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    locked INTEGER NOT NULL DEFAULT 0,
+                    redeemed_at REAL
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS download_tokens_expires_at
+                ON download_tokens (expires_at)
+            """)
 
+    def _forget_connections(self):
+        self.local = threading.local()
 
-def create_download_token(file_path: str, expiry_minutes: int = DEFAULT_EXPIRY_MINUTES):
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _row(self, token: str):
+        row = self._conn().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM download_tokens WHERE token = ?",
+            (token,),
+        ).fetchone()
+
+        if not row:
+            return None
+
+        record = dict(zip(self.COLUMNS, row))
+        record["used"] = bool(record["used"])
+        record["locked"] = bool(record["locked"])
+        return record
+
+    def create(self, record: dict):
+        self._conn().execute(
+            f"INSERT INTO download_tokens ({', '.join(self.COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            tuple(record[c] for c in self.COLUMNS),
+        )
+
+    def get(self, token: str):
+        record = self._row(token)
+
+        if not record:
+            return None
+
+        if time.time() > record["expires_at"]:
+            return None
+
+        return record
+
+    def redeem(self, token: str, pin: str):
+        conn = self._conn()
+        now = time.time()
+
+        # Correct PIN: first redemption, or a resume within the grace window
+        redeemed = conn.execute(
+            """
+            UPDATE download_tokens SET redeemed_at = COALESCE(redeemed_at, ?)
+            WHERE token = ? AND pin = ? AND used = 0 AND locked = 0 AND expires_at >= ?
+              AND (redeemed_at IS NULL OR redeemed_at >= ?)
+            """,
+            (now, token, pin, now, now - DOWNLOAD_GRACE_SECONDS),
+        ).rowcount
+        if redeemed:
+            return REDEEMED, self._row(token)
+
+        # Wrong PIN: count the attempt, lock on the last one
+        counted = conn.execute(
+            """
+            UPDATE download_tokens
+            SET attempts = attempts + 1,
+                locked = CASE WHEN attempts + 1 >= max_attempts THEN 1 ELSE 0 END
+            WHERE token = ? AND pin != ? AND used = 0 AND locked = 0 AND expires_at >= ?
+            """,
+            (token, pin, now),
+        ).rowcount
+
+        record = self._row(token)
+
+        if not record:
+            return NOT_FOUND, None
+        if counted:
+            return (LOCKED_NOW if record["locked"] else INVALID_PIN), record
+        if now > record["expires_at"]:
+            return EXPIRED, record
+        if record["used"]:
+            return ALREADY_USED, record
+        if record["locked"]:
+            return LOCKED, record
+        return ALREADY_USED, record  # grace window over
+
+    def complete(self, token: str, pin: str) -> str | None:
+        row = self._conn().execute(
+            """
+            UPDATE download_tokens SET used = 1
+            WHERE token = ? AND pin = ? AND used = 0 AND redeemed_at IS NOT NULL
+            RETURNING blob_key
+            """,
+            (token, pin),
+        ).fetchone()
+        return row[0] if row else None
+
+    def invalidate(self, token: str):
+        self._conn().execute("UPDATE download_tokens SET used = 1 WHERE token = ?", (token,))
+
+    def cleanup_expired(self) -> list[str]:
+        """Drop expired tokens (index range scan); returns their blob keys."""
+        rows = self._conn().execute(
+            "DELETE FROM download_tokens WHERE expires_at < ? RETURNING blob_key",
+            (time.time(),),
+        ).fetchall()
+
+        return [row[0] for row in rows]
+
+    def next_expiry(self) -> float | None:
+        row = self._conn().execute("SELECT MIN(expires_at) FROM download_tokens").fetchone()
+        next_at = row[0] if row else None
+
+        # Tokens created by other processes don't wake this one up
+        latest = time.time() + TOKEN_SWEEP_MAX_SECONDS
+        return latest if next_at is None else min(next_at, latest)
+
+
+def _create_store():
+    if TOKEN_STORE_BACKEND == "memory":
+        # The PIN / download requests would land on workers that never saw the token
+        if WEB_CONCURRENCY > 1:
+            raise RuntimeError("TOKEN_STORE_BACKEND=memory needs a single worker (WEB_CONCURRENCY=1)")
+        return MemoryTokenStore()
+    if TOKEN_STORE_BACKEND == "sqlite":
+        return SqliteTokenStore(TOKEN_STORE_PATH)
+    raise RuntimeError("TOKEN_STORE_BACKEND must be memory or sqlite")
+
+
+store = _create_store()
+
+# Called with the new token's expires_at (the cleanup loop's wake-up)
+_expiry_listeners = []
+
+
+def on_expiry_scheduled(callback):
+    _expiry_listeners.append(callback)
+
+
+def create_download_token(blob_key: str, expiry_minutes: int = DEFAULT_EXPIRY_MINUTES):
     token = str(uuid4())
     pin = str(random.randint(1000, 9999))  # 4-digit PIN
-    expires_at = datetime.utcnow() + timedelta(minutes=expiry_minutes)
+    expires_at = time.time() + expiry_minutes * 60
 
-    DOWNLOAD_TOKENS[token] = {
-    "token": token,
-    "file_path": file_path,
-    "pin": pin,
-    "expires_at": expires_at,
-    "used": False,
-    "attempts": 0,
-    "max_attempts": 3,
-    "locked": False,
-    }
+    store.create({
+        "token": token,
+        "blob_key": blob_key,
+        "pin": pin,
+        "expires_at": expires_at,
+        "used": False,
+        "attempts": 0,
+        "max_attempts": DEFAULT_MAX_ATTEMPTS,
+        "locked": False,
+        "redeemed_at": None,
+    })
 
+    for callback in _expiry_listeners:
+        callback(expires_at)
 
     return token, pin
 
 
 def get_token(token: str):
-    record = DOWNLOAD_TOKENS.get(token)
+    return store.get(token)
 
-    if not record:
-        return None
 
-    # ⏱ Auto-expire
-    if datetime.utcnow() > record["expires_at"]:
-        del DOWNLOAD_TOKENS[token]
-        return None
+def redeem_token(token: str, pin: str):
+    """
+    Atomically check a PIN and move the token to its next state.
+    A correct PIN keeps working for DOWNLOAD_GRACE_SECONDS after the
+    first one (resumed downloads) until complete_token() is called.
+    Returns (outcome, record snapshot).
+    """
+    return store.redeem(token, pin)
 
-    return record
+
+def complete_token(token: str, pin: str) -> str | None:
+    """
+    The client has the whole file: use the link up. Returns the blob
+    key to evict, or None if the token wasn't redeemed (or is done).
+    """
+    return store.complete(token, pin)
 
 
 def invalidate_token(token: str):
-    if token in DOWNLOAD_TOKENS:
-        DOWNLOAD_TOKENS[token]["used"] = True
+    store.invalidate(token)
+
 
+async def cleanup_expired_tokens():
+    """Remove expired tokens and evict their PDFs from the blob store"""
+    for blob_key in store.cleanup_expired():
+        await delete_blob(blob_key)
 
-def cleanup_expired_tokens():
-    """Remove expired tokens from memory"""
-    now = datetime.utcnow()
-    expired_tokens = [
-        token for token, record in DOWNLOAD_TOKENS.items()
-        if record["expires_at"] < now
-    ]
 
-    for token in expired_tokens:
-        del DOWNLOAD_TOKENS[token]
+def seconds_until_next_expiry() -> float | None:
+    """Delay until the earliest deadline, or None if there are no tokens."""
+    next_at = store.next_expiry()
+    if next_at is None:
+        return None
+
+    return max(0.0, next_at - time.time())
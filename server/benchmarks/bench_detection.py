@@ -0,0 +1,85 @@
+"""
+Document detection latency on a synthetic 12MP phone photo.
+
+    cd server
+    python benchmarks/bench_detection.py [--runs 10]
+
+Compares full-resolution detection (the old behaviour) against
+detection on a downscaled pyramid level.
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.image_processing import enhance_document, find_document_quad  # noqa: E402
+
+
+def synthetic_photo(width=4000, height=3000, seed=0):
+    """A skewed white page with text-like noise on a textured desk."""
+    rng = np.random.default_rng(seed)
+
+    desk = rng.integers(60, 120, (height, width, 3), dtype=np.uint8)
+    desk = cv2.GaussianBlur(desk, (0, 0), 3)
+
+    page = np.array([
+        [width * 0.18, height * 0.08],
+        [width * 0.80, height * 0.12],
+        [width * 0.84, height * 0.93],
+        [width * 0.14, height * 0.90],
+    ], dtype=np.int32)
+    cv2.fillConvexPoly(desk, page, (235, 235, 235))
+
+    for _ in range(400):
+        x = int(rng.integers(width * 0.25, width * 0.75))
+        y = int(rng.integers(height * 0.15, height * 0.85))
+        cv2.line(desk, (x, y), (x + int(rng.integers(40, 300)), y), (30, 30, 30), 3)
+
+    return desk
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), min(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-edge", type=int, default=800)
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1)
+    image = synthetic_photo()
+    print(f"input: {image.shape[1]}x{image.shape[0]} ({image.shape[0] * image.shape[1] / 1e6:.1f} MP)")
+
+    cases = [
+        ("detect  full-res", lambda: find_document_quad(image, 0)),
+        (f"detect  {args.max_edge}px", lambda: find_document_quad(image, args.max_edge)),
+        ("enhance full-res", lambda: enhance_document(image, 0)),
+        (f"enhance {args.max_edge}px", lambda: enhance_document(image, args.max_edge)),
+    ]
+
+    for name, fn in cases:
+        median, best = timed(fn, args.runs)
+        print(f"{name:<18} median {median:8.1f} ms   min {best:8.1f} ms")
+
+    full = find_document_quad(image, 0)
+    small = find_document_quad(image, args.max_edge)
+    if full is not None and small is not None:
+        drift = np.abs(np.sort(full, axis=0) - np.sort(small, axis=0)).max()
+        print(f"max corner drift vs full-res: {drift:.1f} px")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Import-time report for `app.main`, checked against a budget.
+
+    cd server
+    python benchmarks/bench_imports.py [--budget-ms 450] [--top 15]
+
+Runs `python -X importtime -c "import app.main"` in a clean child
+process with no provider secrets set, prints the slowest modules
+(cumulative) and exits non-zero when the app's own import time is over
+budget or when a heavy library (cv2, numpy, boto3, ...) was imported
+eagerly. Suitable as a CI gate.
+
+The budget is for app.main minus a bare `import fastapi` measured the
+same way, so it tracks what the app adds rather than how fast the
+machine is.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parents[1]
+
+# Must only load on first use (see app.utils.providers)
+HEAVY_MODULES = ("cv2", "numpy", "PIL", "reportlab", "boto3", "botocore", "cryptography")
+
+_CHECK_HEAVY = (
+    "import sys, app.main\n"
+    f"heavy = {HEAVY_MODULES!r}\n"
+    "print(','.join(m for m in heavy if m in sys.modules"
+    " and type(sys.modules[m]).__name__ != '_LazyModule'))\n"
+)
+
+
+def _clean_env() -> dict:
+    # No secrets: the app has to boot without them
+    env = {key: value for key, value in os.environ.items() if key in ("PATH", "HOME", "LANG", "TMPDIR")}
+    env["PYTHONPATH"] = str(SERVER_DIR)
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def import_times(module: str = "app.main") -> list[tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) for one cold-ish import of `module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SERVER_DIR,
+        env=_clean_env(),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line.removeprefix("import time:").split("|")
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+
+    return rows
+
+
+def eager_heavy_modules() -> list[str]:
+    result = subprocess.run(
+        [sys.executable, "-c", _CHECK_HEAVY],
+        cwd=SERVER_DIR,
+        env=_clean_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", 450)))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    # Interleaved, so load on the machine hits both alike
+    runs, baselines = [], []
+    for _ in range(args.runs):
+        runs.append(import_times())
+        baselines.append(import_times("fastapi"))
+
+    total = statistics.median(dict((m, c) for m, _, c in rows)["app.main"] / 1000 for rows in runs)
+    baseline = statistics.median(dict((m, c) for m, _, c in rows)["fastapi"] / 1000 for rows in baselines)
+    own = total - baseline
+
+    print(f"import app.main: median {total:.0f} ms, {own:.0f} ms over `import fastapi` ({baseline:.0f} ms)"
+          f" over {args.runs} runs (budget {args.budget_ms:.0f} ms)\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for module, self_us, cumulative_us in sorted(runs[-1], key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {module}")
+
+    failures = []
+    if own > args.budget_ms:
+        failures.append(f"import time {own:.0f} ms over fastapi is over the {args.budget_ms:.0f} ms budget")
+
+    eager = eager_heavy_modules()
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+
+    if failures:
+        print("\nFAIL: " + "; ".join(failures))
+        sys.exit(1)
+
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
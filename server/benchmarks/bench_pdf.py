@@ -0,0 +1,164 @@
+"""
+Single-image PDF generation: ReportLab (the app's original canvas
+path, kept here as reportlab_pdf) vs the built-in writer
+(pdf_writer.write_image_pdf).
+
+    cd server
+    python benchmarks/bench_pdf.py [--runs 10]
+
+Reports median latency, peak RSS growth and import time. Each
+measurement that touches memory or imports runs in a fresh interpreter.
+"""
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+# Everything each render needs loaded (kept out of the render timings)
+IMPORTS = {
+    "reportlab": "import reportlab.pdfgen.canvas, reportlab.lib.utils, reportlab.lib.pagesizes",
+    "native": "from app.services.pdf_writer import write_image_pdf, jpeg_image, png_image",
+}
+
+# Just the PDF libraries
+BARE_IMPORTS = {
+    "reportlab": "import reportlab.pdfgen.canvas, reportlab.lib.utils",
+    "native": "import app.services.pdf_writer",
+}
+
+
+def sample_images():
+    import cv2
+    sys.path.insert(0, str(ROOT / "benchmarks"))
+    from bench_detection import synthetic_photo
+
+    photo = synthetic_photo()
+    return {
+        "jpeg": cv2.imencode(".jpg", photo, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes(),
+        "png": cv2.imencode(".png", cv2.cvtColor(photo, cv2.COLOR_BGR2GRAY))[1].tobytes(),
+    }
+
+
+def reportlab_pdf(image_bytes):
+    """One encoded image (JPEG/PNG) on an A4 page, via the ReportLab canvas."""
+    from reportlab.lib import pagesizes, utils
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=pagesizes.A4)
+
+    img = utils.ImageReader(BytesIO(image_bytes))
+    width, height = pagesizes.A4
+    img_width, img_height = img.getSize()
+    scale = min(width / img_width, height / img_height)
+
+    c.drawImage(
+        img,
+        (width - img_width * scale) / 2,
+        (height - img_height * scale) / 2,
+        width=img_width * scale,
+        height=img_height * scale,
+        preserveAspectRatio=True,
+        mask="auto",
+    )
+    c.showPage()
+    c.save()
+
+    return buffer.getvalue()
+
+
+def render(engine, kind, data):
+    if engine == "reportlab":
+        return reportlab_pdf(data)
+
+    from app.services.pdf_writer import jpeg_image, png_image, write_image_pdf
+    page = jpeg_image(data) if kind == "jpeg" else png_image(data)
+    return write_image_pdf([page])
+
+
+def peak_rss_kb():
+    # ru_maxrss survives fork+exec on Linux (it would report the parent's
+    # peak), VmHWM is per address space
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(engine, kind, path, runs):
+    """Runs in a fresh interpreter: latency + peak RSS for one case."""
+    exec(IMPORTS[engine])  # keep import cost out of the render numbers
+    data = Path(path).read_bytes()
+
+    base = peak_rss_kb()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        pdf = render(engine, kind, data)
+        samples.append((time.perf_counter() - start) * 1000)
+    peak = peak_rss_kb()
+
+    print(json.dumps({
+        "median_ms": statistics.median(samples),
+        "rss_growth_kb": peak - base,
+        "input_bytes": len(data),
+        "pdf_bytes": len(pdf),
+    }))
+
+
+def import_time(statement, runs=5):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", f"import time; t = time.perf_counter(); {statement}; print(time.perf_counter() - t)"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        )
+        samples.append(float(out.stdout) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--child", nargs=3, metavar=("ENGINE", "KIND", "PATH"))
+    args = parser.parse_args()
+
+    if args.child:
+        return child(*args.child, args.runs)
+
+    workdir = Path(tempfile.mkdtemp())
+    samples = sample_images()
+    for kind, data in samples.items():
+        (workdir / kind).write_bytes(data)
+
+    print(f"{'case':<18}{'median ms':>12}{'peak RSS +KB':>15}{'input':>12}{'pdf':>12}")
+    for kind in samples:
+        for engine in ("reportlab", "native"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", engine, kind, str(workdir / kind), "--runs", str(args.runs)],
+                capture_output=True, text=True, check=True,
+            )
+            r = json.loads(out.stdout)
+            print(f"{engine + ' ' + kind:<18}{r['median_ms']:>12.1f}{r['rss_growth_kb']:>15}"
+                  f"{r['input_bytes']:>12}{r['pdf_bytes']:>12}")
+
+    print()
+    for engine in ("reportlab", "native"):
+        print(f"import {engine:<10} {import_time(BARE_IMPORTS[engine]):8.1f} ms (library)"
+              f"   {import_time(IMPORTS[engine]):8.1f} ms (render imports)")
+
+
+if __name__ == "__main__":
+    main()
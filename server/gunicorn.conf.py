@@ -0,0 +1,53 @@
+"""
+Production server config.
+
+    cd server
+    gunicorn app.main:app
+
+The app is imported once in the master (preload_app) and forked, so
+code and read-only state are shared copy-on-write between workers.
+Each worker then runs the startup warm-up (app.services.warmup)
+before it accepts connections.
+"""
+import gc
+import os
+
+# -----------------------------
+# WORKERS
+# -----------------------------
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+
+# Exported before the app is imported: the scan pipeline splits the
+# cores between this many workers (see app.services.pipeline), and
+# with more than one the download tokens and scan jobs default to the
+# shared SQLite stores
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+preload_app = True
+
+# Recycle workers to bound memory growth; jitter keeps them from all
+# restarting (and warming up) at the same moment
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+# Covers the warm-up, which runs before a worker reports ready
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+
+# -----------------------------
+# HOOKS
+# -----------------------------
+def when_ready(server):
+    # Master only, after the app import and before the first fork
+    from app.services.warmup import preload
+
+    preload()
+
+    # Keep the shared objects out of the workers' GC passes, which
+    # would otherwise touch (and un-share) their pages
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,76 @@
+import asyncio
+import base64
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.utils import r2
+from app.utils.blob_store import ObjectBlobStore
+from app.utils.circuit_breaker import CLOSED, OPEN
+
+
+class FakeS3:
+    """Answers every get_object with the same error."""
+
+    def __init__(self, code: str, status: int):
+        self.code = code
+        self.status = status
+        self.calls = 0
+
+    def get_object(self, **kwargs):
+        self.calls += 1
+        raise ClientError(
+            {"Error": {"Code": self.code}, "ResponseMetadata": {"HTTPStatusCode": self.status}},
+            "GetObject",
+        )
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = r2._BREAKER
+    monkeypatch.setattr(breaker, "state", CLOSED)
+    monkeypatch.setattr(breaker, "failures", 0)
+    return breaker
+
+
+def _client(monkeypatch, code: str, status: int) -> FakeS3:
+    client = FakeS3(code, status)
+    monkeypatch.setattr(r2, "get_r2_client", lambda: client)
+    return client
+
+
+def _store() -> ObjectBlobStore:
+    return ObjectBlobStore("downloads/", base64.urlsafe_b64encode(bytes(32)).decode())
+
+
+def test_missing_blobs_leave_the_breaker_closed(monkeypatch, breaker):
+    client = _client(monkeypatch, "NoSuchKey", 404)
+    store = _store()
+
+    for _ in range(breaker.failure_threshold * 3):
+        assert asyncio.run(store.get("0" * 32)) is None
+
+    assert client.calls == breaker.failure_threshold * 3
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+
+
+def test_other_4xx_are_raised_without_counting(monkeypatch, breaker):
+    _client(monkeypatch, "AccessDenied", 403)
+
+    for _ in range(breaker.failure_threshold * 2):
+        with pytest.raises(r2.R2RejectedError) as error:
+            asyncio.run(r2.r2_call("get_object", Bucket="bucket", Key="key"))
+        assert error.value.code == "AccessDenied"
+
+    assert breaker.state == CLOSED
+
+
+def test_server_errors_still_open_the_breaker(monkeypatch, breaker):
+    _client(monkeypatch, "InternalError", 500)
+
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(ClientError):
+            asyncio.run(r2.r2_call("get_object", Bucket="bucket", Key="key"))
+
+    assert breaker.state == OPEN
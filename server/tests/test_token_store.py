@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from app.utils import token_store
+from app.utils.token_store import (
+    ALREADY_USED,
+    EXPIRED,
+    INVALID_PIN,
+    LOCKED,
+    LOCKED_NOW,
+    NOT_FOUND,
+    REDEEMED,
+    MemoryTokenStore,
+    SqliteTokenStore,
+)
+
+PIN = "1234"
+WRONG_PIN = "0000"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryTokenStore()
+    return SqliteTokenStore(str(tmp_path / "tokens.db"))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen time.time() for the token store; advance with clock.now += seconds."""
+
+    class Clock:
+        now = time.time()
+
+    monkeypatch.setattr(token_store.time, "time", lambda: Clock.now)
+    return Clock
+
+
+def _token(store, expires_in: float = 3600, max_attempts: int = 3) -> str:
+    store.create({
+        "token": "token",
+        "blob_key": "blob",
+        "pin": PIN,
+        "expires_at": time.time() + expires_in,
+        "used": False,
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "locked": False,
+        "redeemed_at": None,
+    })
+    return "token"
+
+
+def test_wrong_pins_count_down_then_lock(store):
+    token = _token(store)
+
+    outcome, record = store.redeem(token, WRONG_PIN)
+    assert outcome == INVALID_PIN
+    assert record["max_attempts"] - record["attempts"] == 2
+
+    outcome, record = store.redeem(token, WRONG_PIN)
+    assert outcome == INVALID_PIN
+    assert record["max_attempts"] - record["attempts"] == 1
+
+    outcome, record = store.redeem(token, WRONG_PIN)
+    assert outcome == LOCKED_NOW
+    assert record["locked"]
+
+    # Locked for good, even with the right PIN
+    assert store.redeem(token, WRONG_PIN)[0] == LOCKED
+    assert store.redeem(token, PIN)[0] == LOCKED
+    assert store.redeem(token, PIN)[1]["attempts"] == 3
+
+
+def test_concurrent_wrong_pins_lock_exactly_once(store):
+    token = _token(store)
+    barrier = threading.Barrier(10)
+    outcomes = []
+
+    def attempt():
+        barrier.wait()
+        outcomes.append(store.redeem(token, WRONG_PIN)[0])
+
+    threads = [threading.Thread(target=attempt) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert Counter(outcomes) == {INVALID_PIN: 2, LOCKED_NOW: 1, LOCKED: 7}
+
+
+def test_correct_pin_resumes_within_grace_window(store, clock):
+    token = _token(store)
+
+    outcome, first = store.redeem(token, PIN)
+    assert outcome == REDEEMED
+    assert first["redeemed_at"] == clock.now
+
+    # Resumed download: same PIN, first redemption time kept
+    clock.now += token_store.DOWNLOAD_GRACE_SECONDS - 1
+    outcome, record = store.redeem(token, PIN)
+    assert outcome == REDEEMED
+    assert record["redeemed_at"] == first["redeemed_at"]
+
+    clock.now += 2
+    assert store.redeem(token, PIN)[0] == ALREADY_USED
+
+
+def test_complete_uses_the_link_up(store):
+    token = _token(store)
+
+    # Only a redeemed token can be completed
+    assert store.complete(token, PIN) is None
+
+    assert store.redeem(token, PIN)[0] == REDEEMED
+    assert store.complete(token, WRONG_PIN) is None
+    assert store.complete(token, PIN) == "blob"
+    assert store.complete(token, PIN) is None
+    assert store.redeem(token, PIN)[0] == ALREADY_USED
+
+
+def test_wrong_pin_in_grace_window_still_counts(store):
+    token = _token(store)
+
+    assert store.redeem(token, PIN)[0] == REDEEMED
+    assert store.redeem(token, WRONG_PIN)[0] == INVALID_PIN
+    assert store.redeem(token, PIN)[0] == REDEEMED
+
+
+def test_expired_and_unknown_tokens(store, clock):
+    token = _token(store, expires_in=60)
+
+    clock.now += 61
+    assert store.redeem(token, PIN)[0] == EXPIRED
+    assert store.redeem(token, WRONG_PIN)[0] == EXPIRED
+    assert store.redeem("missing", PIN) == (NOT_FOUND, None)